@@ -1,19 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Form, File, UploadFile
-import shutil, os, uuid
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import or_
 from datetime import datetime
-from database import templates
+from templating import templates
 
 from database import get_db
 from auth_utils import verify_token, get_password_hash, create_access_token
-import crud, models
+import crud, models, archival, vote_counters, uploads
 
 router = APIRouter()
 
-UPLOAD_DIR = "static/uploads"
 
 # Dependência para garantir que é ADMIN
 def get_current_admin(request: Request, db: Session = Depends(get_db)):
@@ -53,16 +51,16 @@ def admin_dashboard(
     users = users_query.order_by(models.User.id.desc()).all()
 
     # --- BUSCA DE ENQUETES ---
-    polls_query = db.query(models.Poll)
+    polls_query = db.query(models.Poll).options(joinedload(models.Poll.creator))
     if q_polls:
         polls_query = polls_query.filter(models.Poll.title.like(f"%{q_polls}%"))
     polls = polls_query.order_by(models.Poll.id.desc()).all()
     
-    # Metadados adicionais
+    # Metadados adicionais (total de votos numa consulta só, autor já carregado no JOIN)
+    totals = crud.get_vote_totals(db, [p.id for p in polls])
     for p in polls:
-        p.vote_count = db.query(models.Vote).filter(models.Vote.poll_id == p.id).count()
-        creator = db.query(models.User).filter(models.User.id == p.creator_id).first()
-        p.creator_email = creator.email if creator else "Conta excluída"
+        p.vote_count = totals.get(p.id, 0)
+        p.creator_email = p.creator.email if p.creator else "Conta excluída"
 
     return templates.TemplateResponse("admin_dashboard.html", {
         "request": request, 
@@ -70,7 +68,9 @@ def admin_dashboard(
         "polls": polls,
         "admin": admin,
         "q_users": q_users,
-        "q_polls": q_polls
+        "q_polls": q_polls,
+        "default_counter_shards": vote_counters.VOTE_COUNTER_SHARDS,
+        "max_counter_shards": vote_counters.MAX_COUNTER_SHARDS
     })
 
 @router.get("/setup", response_class=HTMLResponse)
@@ -121,6 +121,7 @@ def admin_setup_action(
     admin_user.email = email
     admin_user.hashed_password = get_password_hash(password)
     db.commit()
+    crud.invalidate_user_polls_cache(db, admin_user.id)
     
     # 4. Gera novo token (Login Automático) e Redireciona para Dashboard
     access_token = create_access_token(data={"sub": admin_user.email})
@@ -188,25 +189,15 @@ def update_user_action(
         hashed_pw = get_password_hash(password)
 
     # 4. Processamento de Avatar
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    # (a foto antiga não é apagada aqui: sem referências, a limpeza de uploads remove)
     new_avatar_path = None
     should_remove = (remove_avatar == "true")
 
     if avatar and avatar.filename:
-        if user.avatar_path and os.path.exists(user.avatar_path.lstrip("/")):
-            try: os.remove(user.avatar_path.lstrip("/"))
-            except: pass
-        
-        safe_filename = f"avatar_{uuid.uuid4()}_{avatar.filename}"
-        file_location = os.path.join("static/uploads", safe_filename)
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(avatar.file, buffer)
-        new_avatar_path = f"/static/uploads/{safe_filename}"
-    
-    elif should_remove:
-        if user.avatar_path and os.path.exists(user.avatar_path.lstrip("/")):
-            try: os.remove(user.avatar_path.lstrip("/"))
-            except: pass
+        try:
+            new_avatar_path = uploads.save_avatar(avatar)
+        except uploads.UploadError as e:
+            return RedirectResponse(f"/admin?tab=users&error={e}", status_code=303)
 
     # Atualiza tudo, incluindo is_admin
     crud.update_user_details(
@@ -238,6 +229,7 @@ def delete_user(
             for p in user_polls: crud.delete_poll(db, p.id)
         else:
             # Se NÃO marcou: Mantém os dados (Desvincula/Orphan)
+            crud.invalidate_user_polls_cache(db, user_id)
             db.query(models.Poll).filter(models.Poll.creator_id == user_id).update({"creator_id": None})
 
         db.delete(user)
@@ -253,6 +245,7 @@ def toggle_visibility_poll(poll_id: int, request: Request, db: Session = Depends
     if poll:
         poll.is_public = not poll.is_public
         db.commit()
+        crud.invalidate_poll_cache(poll)
     return RedirectResponse("/admin?tab=polls", status_code=303)
 
 @router.post("/polls/{poll_id}/toggle_archive")
@@ -263,6 +256,10 @@ def toggle_archive_poll(poll_id: int, request: Request, db: Session = Depends(ge
     if poll:
         poll.archived = not poll.archived
         db.commit()
+        crud.invalidate_poll_cache(poll)
+        if not poll.archived:
+            crud.discard_results_snapshot(db, poll.id)
+            archival.unfreeze_poll(db, poll.id)
     return RedirectResponse("/admin?tab=polls", status_code=303)
 
 @router.post("/polls/{poll_id}/update_deadline")
@@ -278,6 +275,23 @@ def admin_update_deadline(poll_id: int, request: Request, deadline: str = Form(N
     crud.update_poll_deadline(db, poll_id, deadline_dt)
     return RedirectResponse("/admin?tab=polls", status_code=303)
 
+@router.post("/polls/{poll_id}/counter_shards")
+def admin_update_counter_shards(poll_id: int, request: Request, shards: str = Form(None), db: Session = Depends(get_db)):
+    """
+    Linhas de contador por opção (mais linhas = menos disputa em enquetes virais). Vazio = padrão.
+    """
+    admin = get_current_admin(request, db)
+    if not admin: return RedirectResponse("/login", status_code=303)
+    poll = db.query(models.Poll).filter(models.Poll.id == poll_id).first()
+    if poll:
+        value = None
+        if shards and shards.strip().isdigit():
+            value = max(1, min(int(shards), vote_counters.MAX_COUNTER_SHARDS))
+        poll.counter_shards = value
+        db.commit()
+        crud.invalidate_poll_cache(poll)
+    return RedirectResponse("/admin?tab=polls", status_code=303)
+
 @router.post("/polls/{poll_id}/delete")
 def admin_delete_poll(poll_id: int, request: Request, db: Session = Depends(get_db)):
     admin = get_current_admin(request, db)
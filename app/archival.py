@@ -0,0 +1,190 @@
+import os
+import json
+import zlib
+import logging
+from datetime import datetime
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+import models, crud, rollups, vote_limit
+from ip_keys import voter_key
+from tasks import periodic_job
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", 3600))
+# 1 = além de congelar a apuração, tira os votos brutos da tabela votes
+# (vão comprimidos para archived_vote_chunks e voltam se a enquete for desarquivada)
+ARCHIVE_COLD_STORAGE = os.getenv("ARCHIVE_COLD_STORAGE", "1") == "1"
+ARCHIVE_CHUNK_SIZE = 50000
+ARCHIVE_POLLS_PER_RUN = 20
+# Lotes da tabela fria devolvidos a votes por execução (enquetes desarquivadas)
+ARCHIVE_REHYDRATE_CHUNKS_PER_RUN = int(os.getenv("ARCHIVE_REHYDRATE_CHUNKS_PER_RUN", 20))
+
+_vote_table = models.Vote.__table__
+
+def pack_votes(rows) -> bytes:
+    data = [[vote_id, option_id, voter_ip.hex(), voted_at.isoformat() if voted_at else None]
+            for vote_id, option_id, voter_ip, voted_at in rows]
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 9)
+
+def _stored_voter_key(value: str, anonymous: bool) -> bytes:
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        # Lotes gravados antes das chaves binárias guardam o IP em texto
+        return voter_key(value, anonymous)
+
+def unpack_votes(payload: bytes, anonymous: bool = False):
+    for vote_id, option_id, voter_ip, voted_at in json.loads(zlib.decompress(payload)):
+        yield vote_id, option_id, _stored_voter_key(voter_ip, anonymous), datetime.fromisoformat(voted_at) if voted_at else None
+
+def _lock_poll(db: Session, poll_id: int):
+    return db.query(models.Poll).filter(models.Poll.id == poll_id).with_for_update().first()
+
+def freeze_poll(db: Session, poll_id: int) -> bool:
+    """
+    Congela a apuração de uma enquete arquivada e, com ARCHIVE_COLD_STORAGE,
+    move os votos brutos para a tabela fria. Tudo numa transação.
+    """
+    poll = _lock_poll(db, poll_id)
+    if not poll or not poll.archived or poll.frozen_up_to_vote_id is not None or poll.votes_archived:
+        # votes_archived sem marca: votos ainda voltando da tabela fria (rehydrate_chunk)
+        db.rollback()
+        return False
+
+    # Só congela votos que os gráficos (rollups) já agregaram
+    max_vote_id = db.query(func.max(models.Vote.id)).filter(models.Vote.poll_id == poll_id).scalar() or 0
+    if max_vote_id > int(crud.get_job_state(db, rollups.LAST_VOTE_KEY) or 0):
+        db.rollback()
+        return False
+
+    # Votos que chegarem depois da leitura de max_vote_id ficam vivos em votes
+    # (acima de frozen_up_to_vote_id, somados normalmente)
+    counts = db.query(models.Vote.option_id, func.count(models.Vote.id)).filter(
+        models.Vote.poll_id == poll_id,
+        models.Vote.id <= max_vote_id
+    ).group_by(models.Vote.option_id).all()
+    for option_id, votes in counts:
+        db.add(models.PollTally(poll_id=poll_id, option_id=option_id, count=votes))
+
+    if ARCHIVE_COLD_STORAGE and max_vote_id:
+        last_id, chunk = 0, 0
+        while True:
+            rows = db.query(models.Vote.id, models.Vote.option_id, models.Vote.voter_ip, models.Vote.voted_at).filter(
+                models.Vote.poll_id == poll_id,
+                models.Vote.id > last_id,
+                models.Vote.id <= max_vote_id
+            ).order_by(models.Vote.id).limit(ARCHIVE_CHUNK_SIZE).all()
+            if not rows:
+                break
+            db.add(models.ArchivedVoteChunk(poll_id=poll_id, chunk=chunk, vote_count=len(rows), payload=pack_votes(rows)))
+            db.flush()
+            last_id, chunk = rows[-1][0], chunk + 1
+        db.query(models.Vote).filter(
+            models.Vote.poll_id == poll_id,
+            models.Vote.id <= max_vote_id
+        ).delete(synchronize_session=False)
+        poll.votes_archived = True
+
+    poll.frozen_up_to_vote_id = max_vote_id
+    db.commit()
+    crud.invalidate_poll_cache(poll)
+    return True
+
+def unfreeze_poll(db: Session, poll_id: int):
+    """
+    Desfaz o congelamento quando a enquete volta a ficar ativa. Na requisição
+    só sai a marca; os votos da tabela fria voltam aos poucos pela tarefa de
+    arquivamento (rehydrate_chunk), e enquanto isso votes_archived continua ligado.
+    """
+    poll = _lock_poll(db, poll_id)
+    if not poll or poll.frozen_up_to_vote_id is None:
+        db.rollback()
+        return
+
+    if not poll.votes_archived:
+        # Nada na tabela fria: a apuração volta a ser feita só sobre votes
+        db.query(models.PollTally).filter(models.PollTally.poll_id == poll_id).delete(synchronize_session=False)
+    poll.frozen_up_to_vote_id = None
+    db.commit()
+    crud.invalidate_poll_cache(poll)
+
+def rehydrate_chunk(db: Session, poll_id: int) -> bool:
+    """
+    Devolve um lote da tabela fria para votes, com os ids originais (as tarefas
+    com marca d'água não os contam de novo). A apuração congelada perde os votos
+    do lote, então poll_tallies + votes continua somando o total certo.
+    False = não há mais lotes (ou a enquete não está esperando a volta).
+    """
+    poll = _lock_poll(db, poll_id)
+    if not poll or not poll.votes_archived or poll.frozen_up_to_vote_id is not None:
+        db.rollback()
+        return False
+
+    stored = db.query(models.ArchivedVoteChunk).filter(
+        models.ArchivedVoteChunk.poll_id == poll_id
+    ).order_by(models.ArchivedVoteChunk.chunk).first()
+    if not stored:
+        db.query(models.PollTally).filter(models.PollTally.poll_id == poll_id).delete(synchronize_session=False)
+        poll.votes_archived = False
+        # Contadores de IP dos votos que estavam na tabela fria
+        vote_limit.rebuild(db, poll_id)
+        db.commit()
+        crud.invalidate_poll_cache(poll)
+        return False
+
+    rows = list(unpack_votes(stored.payload, poll.anonymous))
+    db.execute(insert(_vote_table), [
+        {"id": vote_id, "poll_id": poll_id, "option_id": option_id, "voter_ip": voter_ip, "voted_at": voted_at}
+        for vote_id, option_id, voter_ip, voted_at in rows
+    ])
+    returned = {}
+    for _, option_id, _, _ in rows:
+        returned[option_id] = returned.get(option_id, 0) + 1
+    for option_id, votes in returned.items():
+        db.query(models.PollTally).filter(
+            models.PollTally.poll_id == poll_id,
+            models.PollTally.option_id == option_id
+        ).update({models.PollTally.count: models.PollTally.count - votes}, synchronize_session=False)
+    db.delete(stored)
+    db.commit()
+    return True
+
+@periodic_job("arquivamento_votos", ARCHIVE_INTERVAL)
+def archive_polls(db: Session):
+    # Primeiro as enquetes desarquivadas que ainda têm votos na tabela fria
+    pending = [poll_id for (poll_id,) in db.query(models.Poll.id).filter(
+        models.Poll.votes_archived == True,
+        models.Poll.frozen_up_to_vote_id.is_(None)
+    ).limit(ARCHIVE_POLLS_PER_RUN).all()]
+
+    budget = ARCHIVE_REHYDRATE_CHUNKS_PER_RUN
+    for poll_id in pending:
+        try:
+            while budget > 0 and rehydrate_chunk(db, poll_id):
+                budget -= 1
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Erro ao devolver votos arquivados da enquete {poll_id}: {e}")
+        if budget <= 0:
+            break
+    if budget < ARCHIVE_REHYDRATE_CHUNKS_PER_RUN:
+        logger.info(f"🗄️ Arquivamento: {ARCHIVE_REHYDRATE_CHUNKS_PER_RUN - budget} lotes devolvidos à tabela de votos.")
+
+    poll_ids = [poll_id for (poll_id,) in db.query(models.Poll.id).filter(
+        models.Poll.archived == True,
+        models.Poll.frozen_up_to_vote_id.is_(None),
+        models.Poll.votes_archived == False
+    ).limit(ARCHIVE_POLLS_PER_RUN).all()]
+
+    frozen = 0
+    for poll_id in poll_ids:
+        try:
+            if freeze_poll(db, poll_id):
+                frozen += 1
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Erro ao arquivar votos da enquete {poll_id}: {e}")
+    if frozen:
+        logger.info(f"🗄️ Arquivamento: apuração congelada em {frozen} enquetes.")
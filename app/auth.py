@@ -1,12 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Form, Response, Request, Cookie, BackgroundTasks
 from fastapi.responses import RedirectResponse, HTMLResponse
-from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import timedelta
 
 # Imports do sistema
 from database import get_db
+from templating import templates
 import crud, models
 
 # Utilitários de Autenticação
@@ -24,9 +24,9 @@ from auth_utils import (
 
 # Utilitários de E-mail
 from email_utils import send_verification_email, send_reset_password_email
+from metrics import track_background
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 # --- LOGIN E REGISTRO ---
 
@@ -65,7 +65,7 @@ def register(
     # Enviar e-mail de verificação
     verify_token_str = create_verification_token(email)
     base_url = str(request.base_url)
-    background_tasks.add_task(send_verification_email, email, verify_token_str, base_url)
+    background_tasks.add_task(track_background("email", send_verification_email), email, verify_token_str, base_url)
     
     return templates.TemplateResponse("register_success.html", {"request": request})
 
@@ -139,7 +139,7 @@ def forgot_password_action(
 
     reset_token = create_reset_token(email)
     base_url = str(request.base_url)
-    background_tasks.add_task(send_reset_password_email, email, reset_token, base_url)
+    background_tasks.add_task(track_background("email", send_reset_password_email), email, reset_token, base_url)
     
     return templates.TemplateResponse("reset_sent.html", {"request": request})
 
@@ -191,7 +191,7 @@ def resend_verification(
     if user and not user.is_verified:
         verify_token_str = create_verification_token(email)
         base_url = str(request.base_url)
-        background_tasks.add_task(send_verification_email, email, verify_token_str, base_url)
+        background_tasks.add_task(track_background("email", send_verification_email), email, verify_token_str, base_url)
         # Mudança: Redireciona para a home com mensagem de sucesso
         return RedirectResponse("/?success=E-mail de verificação reenviado! Verifique sua caixa de entrada.", status_code=303)
     
@@ -0,0 +1,297 @@
+import os
+import time
+import uuid
+import pickle
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Cache em memória com limite de itens (descarta o menos usado) e TTL opcional.
+    Thread-safe, pois as rotas síncronas do FastAPI rodam num threadpool.
+    `on_evict(key)` é chamado (fora do lock) para cada chave descartada por tamanho ou validade.
+    """
+    def __init__(self, max_size: int = 1024, ttl: float | None = None, on_evict=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at is None or expires_at >= time.monotonic():
+                self._data.move_to_end(key)
+                return value
+            del self._data[key]
+        if self.on_evict:
+            self.on_evict(key)
+        return default
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        evicted = []
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                evicted.append(self._data.popitem(last=False)[0])
+        if self.on_evict:
+            for old_key in evicted:
+                self.on_evict(old_key)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+# --- BACKENDS COMPARTILHÁVEIS ---
+
+class CacheBackend(ABC):
+    """
+    Interface comum dos caches da aplicação: TTL por chave, invalidação
+    por tag e get_or_set com "single-flight" (só um processo/thread
+    recalcula uma chave expirada, os demais aguardam o resultado).
+    Valores None não são guardados (servem como "não encontrado").
+    """
+    @abstractmethod
+    def get(self, key: str, default=None):
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value, ttl: float | None = None, tags=()):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def invalidate_tag(self, tag: str):
+        ...
+
+    @abstractmethod
+    def get_or_set(self, key: str, loader, ttl: float | None = None, tags=()):
+        ...
+
+class MemoryCache(CacheBackend):
+    """
+    Implementação local (por processo). Serve para desenvolvimento,
+    benchmarks e instalações com um único worker.
+    """
+    def __init__(self, max_size: int = 4096):
+        self._entries = LRUCache(max_size=max_size, on_evict=self._forget_tags)
+        # tag -> chaves e chave -> tags: as tags só apontam para chaves que ainda estão
+        # no LRU, então não crescem além de max_size (ex: páginas com cursor qualquer)
+        self._tags = {}
+        self._key_tags = {}
+        self._tags_lock = threading.RLock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    def _forget_tags(self, key):
+        with self._tags_lock:
+            for tag in self._key_tags.pop(key, ()):
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+
+    def get(self, key, default=None):
+        return self._entries.get(key, default)
+
+    def set(self, key, value, ttl=None, tags=()):
+        if value is None:
+            return
+        if not tags:
+            self._entries.set(key, value, ttl=ttl)
+            return
+        # Sob o lock das tags (reentrante: o descarte chama _forget_tags), para um descarte
+        # simultâneo da versão anterior da chave não apagar as tags da nova
+        with self._tags_lock:
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self._key_tags.setdefault(key, set()).update(tags)
+            self._entries.set(key, value, ttl=ttl)
+
+    def delete(self, key):
+        self._entries.delete(key)
+        self._forget_tags(key)
+
+    def invalidate_tag(self, tag):
+        with self._tags_lock:
+            keys = self._tags.pop(tag, set())
+        for key in keys:
+            self._entries.delete(key)
+            self._forget_tags(key)
+
+    def get_or_set(self, key, loader, ttl=None, tags=()):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._flights_lock:
+            flight = self._flights.setdefault(key, threading.Lock())
+
+        with flight:
+            # Outra thread pode ter calculado enquanto esperávamos
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            try:
+                value = loader()
+                self.set(key, value, ttl=ttl, tags=tags)
+                return value
+            finally:
+                with self._flights_lock:
+                    self._flights.pop(key, None)
+
+class RedisCache(CacheBackend):
+    """
+    Implementação compartilhada entre workers/réplicas via protocolo Redis.
+    Aceita um cliente pronto (ex: fakeredis nos testes) ou uma URL.
+    Se o Redis ficar indisponível, o site continua funcionando sem cache.
+    """
+    TAG_TTL = 86400
+    LOCK_TTL_MS = 10000
+    LOCK_WAIT = 5.0
+    LOCK_POLL = 0.05
+    # Só apaga o lock se ele ainda for deste processo: com o loader passando de
+    # LOCK_TTL_MS o lock expira e pode já ser de outro
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url: str = None, client=None, prefix: str = "enquetes:"):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("Pacote 'redis' não instalado. Adicione-o ao requirements.txt para usar CACHE_URL=redis://...")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self._release_script = client.register_script(self.RELEASE_SCRIPT)
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def _tag_key(self, tag):
+        return f"{self.prefix}tag:{tag}"
+
+    def get(self, key, default=None):
+        try:
+            raw = self.client.get(self._key(key))
+        except Exception as e:
+            logger.warning(f"Cache Redis indisponível (get): {e}")
+            return default
+        if raw is None:
+            return default
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None, tags=()):
+        if value is None:
+            return
+        full_key = self._key(key)
+        try:
+            pipe = self.client.pipeline()
+            if ttl:
+                pipe.set(full_key, pickle.dumps(value), px=int(ttl * 1000))
+            else:
+                pipe.set(full_key, pickle.dumps(value))
+            for tag in tags:
+                tag_key = self._tag_key(tag)
+                pipe.sadd(tag_key, full_key)
+                # O conjunto da tag precisa viver mais que as chaves que ele aponta
+                pipe.expire(tag_key, self.TAG_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Cache Redis indisponível (set): {e}")
+
+    def delete(self, key):
+        try:
+            self.client.delete(self._key(key))
+        except Exception as e:
+            logger.warning(f"Cache Redis indisponível (delete): {e}")
+
+    def invalidate_tag(self, tag):
+        tag_key = self._tag_key(tag)
+        try:
+            keys = self.client.smembers(tag_key)
+            pipe = self.client.pipeline()
+            if keys:
+                pipe.delete(*keys)
+            pipe.delete(tag_key)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Cache Redis indisponível (invalidate_tag): {e}")
+
+    def get_or_set(self, key, loader, ttl=None, tags=()):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        lock_key = self._key(f"lock:{key}")
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.client.set(lock_key, token, nx=True, px=self.LOCK_TTL_MS)
+        except Exception:
+            return loader()
+
+        if not acquired:
+            # Outro processo está recalculando: aguarda o valor aparecer
+            deadline = time.monotonic() + self.LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(self.LOCK_POLL)
+                value = self.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+                try:
+                    if not self.client.exists(lock_key):
+                        break
+                except Exception:
+                    break
+            # Demorou demais (ou o resultado foi None e não ficou em cache): calcula localmente
+            return loader()
+
+        try:
+            value = loader()
+            self.set(key, value, ttl=ttl, tags=tags)
+            return value
+        finally:
+            try: self._release_script(keys=[lock_key], args=[token])
+            except Exception: pass
+
+def build_cache() -> CacheBackend:
+    """
+    CACHE_URL=redis://host:6379/0 usa o Redis (compartilhado entre workers).
+    Sem a variável, usa o cache em memória do próprio processo.
+    """
+    url = os.getenv("CACHE_URL")
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        logger.info("🗄️ Cache compartilhado via Redis habilitado.")
+        return RedisCache(url=url)
+    return MemoryCache(max_size=int(os.getenv("CACHE_MAX_ITEMS", 4096)))
+
+cache = build_cache()
@@ -1,7 +1,32 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import Session, joinedload
 from datetime import datetime, timedelta
+import os
+import json
 import uuid
 import models, schemas
+import edge_cache
+import vote_counters
+import deadlines
+from cache import cache
+
+# Tempos de vida no cache (segundos). O cache pode ser local ou compartilhado (ver cache.py)
+POLL_CACHE_TTL = int(os.getenv("POLL_CACHE_TTL", 300))
+HOME_CACHE_TTL = int(os.getenv("HOME_CACHE_TTL", 30))
+RESULTS_CACHE_TTL = int(os.getenv("RESULTS_CACHE_TTL", 5))
+# Os agregados de votos (rollups.py) são atualizados a cada minuto
+TIMELINE_CACHE_TTL = int(os.getenv("TIMELINE_CACHE_TTL", 60))
+# Janela exibida no gráfico de evolução, por granularidade
+TIMELINE_WINDOWS = {"minute": timedelta(hours=6), "hour": timedelta(days=30)}
+# Votos mais novos que isso ficam fora das marcas d'água (ver get_settled_vote_id)
+VOTE_SETTLE_SECONDS = int(os.getenv("VOTE_SETTLE_SECONDS", 5))
+# Cards por página nos carrosséis da home (o resto vem sob demanda, ver partials.py)
+HOME_PAGE_SIZE = int(os.getenv("HOME_PAGE_SIZE", 12))
+
+HOME_CACHE_TAG = "home"
+
+def _poll_tag(poll_id: int) -> str:
+    return f"poll:{poll_id}"
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
@@ -41,11 +66,157 @@ def create_poll(db: Session, poll: schemas.PollCreate, creator_id: int):
         db.add(db_option)
 
     db.commit()
+    cache.invalidate_tag(HOME_CACHE_TAG)
+    if db_poll.deadline:
+        deadlines.scheduler.schedule(db_poll.id, db_poll.deadline)
     return db_poll
 
 def get_poll_by_link(db: Session, link: str):
     return db.query(models.Poll).filter(models.Poll.public_link == link).first()
 
+def get_poll_snapshot(db: Session, link: str):
+    """
+    Retorna a enquete com suas opções a partir do cache.
+    Só consulta o banco quando o link ainda não está em memória.
+    """
+    def load():
+        poll = get_poll_by_link(db, link)
+        return schemas.PollSnapshot.model_validate(poll) if poll else None
+
+    return cache.get_or_set(f"poll-link:{link}", load, ttl=POLL_CACHE_TTL)
+
+def get_poll_vote_state(db: Session, poll_id: int):
+    """
+    archived/closed/deadline lidos do banco (pela chave primária) na hora do voto:
+    o snapshot em cache pode estar atrasado em outros workers. O lock compartilhado
+    faz arquivar, encerrar ou congelar o resultado esperar os votos em andamento.
+    """
+    return db.query(models.Poll.archived, models.Poll.closed, models.Poll.deadline).filter(
+        models.Poll.id == poll_id
+    ).with_for_update(read=True).first()
+
+def invalidate_poll_cache(poll):
+    """
+    Descarta tudo que foi guardado em cache sobre a enquete
+    (snapshot, apurações) e a listagem da página inicial.
+    Também pede o purge das páginas nos proxies (ver edge_cache.py).
+    """
+    cache.delete(f"poll-link:{poll.public_link}")
+    cache.invalidate_tag(_poll_tag(poll.id))
+    cache.invalidate_tag(HOME_CACHE_TAG)
+    edge_cache.purge_poll(poll)
+
+@deadlines.close_hook()
+def _invalidate_closed_poll(db: Session, poll):
+    # A página passa a mostrar "encerrada" no instante do prazo
+    invalidate_poll_cache(poll)
+
+def invalidate_user_polls_cache(db: Session, user_id: int):
+    polls = db.query(models.Poll.id, models.Poll.public_link).filter(models.Poll.creator_id == user_id).all()
+    for poll in polls:
+        invalidate_poll_cache(poll)
+
+# --- CONTAGEM DE VOTOS ---
+
+def get_vote_totals(db: Session, poll_ids: list[int]) -> dict:
+    """
+    Total de votos de várias enquetes, somando os contadores por opção (ver vote_counters.py).
+    """
+    return vote_counters.get_vote_totals(db, poll_ids)
+
+def get_settled_vote_id(db: Session, after_id: int = 0) -> int:
+    """
+    Até onde uma marca d'água de votos (rollups, ranking) pode avançar.
+    Com auto-increment, o voto N pode aparecer (commit) depois do N+1; por isso só
+    entram votos com mais de VOTE_SETTLE_SECONDS, e a marca para no último deles.
+    A consulta desce pela chave primária a partir do voto mais novo.
+    """
+    cutoff = db.query(func.now()).scalar() - timedelta(seconds=VOTE_SETTLE_SECONDS)
+    row = db.query(models.Vote.id).filter(
+        models.Vote.id > after_id,
+        models.Vote.voted_at < cutoff
+    ).order_by(models.Vote.id.desc()).first()
+    return row[0] if row else after_id
+
+def get_option_counts(db: Session, poll_id: int) -> dict:
+    """
+    Votos por opção ({option_id: votos}), com cache de curta duração.
+    """
+    def load():
+        return vote_counters.get_option_counts(db, poll_id)
+
+    return cache.get_or_set(f"results:{poll_id}", load, ttl=RESULTS_CACHE_TTL, tags=[_poll_tag(poll_id)])
+
+def get_results_snapshot(db: Session, poll_id: int):
+    """
+    Resultado final gravado pela tarefa em result_snapshots.py
+    ({"total_votes", "results", "etag"}) ou None se ainda não existir.
+    """
+    def load():
+        snapshot = db.get(models.PollResultSnapshot, poll_id)
+        if not snapshot:
+            return None
+        data = json.loads(snapshot.payload)
+        data["etag"] = snapshot.etag
+        return data
+
+    return cache.get_or_set(f"results-snapshot:{poll_id}", load, ttl=POLL_CACHE_TTL, tags=[_poll_tag(poll_id)])
+
+def discard_results_snapshot(db: Session, poll_id: int):
+    """
+    Apaga o resultado final quando a enquete volta a aceitar votos
+    (desarquivada ou com prazo alterado); a tarefa grava outro no próximo encerramento.
+    """
+    db.query(models.PollResultSnapshot).filter(models.PollResultSnapshot.poll_id == poll_id).delete(synchronize_session=False)
+    db.commit()
+    cache.delete(f"results-snapshot:{poll_id}")
+
+def build_results(options, counts: dict):
+    """
+    Monta a lista de resultados (texto, votos, porcentagem) usada nos templates.
+    """
+    total_votes = sum(counts.values())
+    results = []
+    for opt in options:
+        votes = counts.get(opt.id, 0)
+        percent = 0
+        if total_votes > 0:
+            percent = round((votes / total_votes) * 100, 1)
+        results.append({"text": opt.text, "votes": votes, "percent": percent})
+    return results, total_votes
+
+def get_vote_timeline(db: Session, poll, granularity: str = "hour") -> dict:
+    """
+    Votos por intervalo de tempo, lidos só da tabela de agregados (nunca dos votos brutos).
+    A janela termina no último intervalo com votos, então enquetes encerradas também têm gráfico.
+    """
+    def load():
+        last = db.query(func.max(models.VoteRollup.bucket_start)).filter(
+            models.VoteRollup.poll_id == poll.id,
+            models.VoteRollup.granularity == granularity
+        ).scalar()
+        option_index = {opt.id: i for i, opt in enumerate(poll.options)}
+        points = []
+        if last is not None:
+            rows = db.query(models.VoteRollup.bucket_start, models.VoteRollup.option_id, models.VoteRollup.count).filter(
+                models.VoteRollup.poll_id == poll.id,
+                models.VoteRollup.granularity == granularity,
+                models.VoteRollup.bucket_start > last - TIMELINE_WINDOWS[granularity]
+            ).order_by(models.VoteRollup.bucket_start).all()
+            by_bucket = {}
+            for start, option_id, count in rows:
+                votes = by_bucket.setdefault(start, [0] * len(option_index))
+                if option_id in option_index:
+                    votes[option_index[option_id]] += count
+            points = [{"t": start.isoformat(), "votes": votes} for start, votes in by_bucket.items()]
+        return {
+            "granularity": granularity,
+            "options": [{"id": opt.id, "text": opt.text} for opt in poll.options],
+            "points": points,
+        }
+
+    return cache.get_or_set(f"timeline:{poll.id}:{granularity}", load, ttl=TIMELINE_CACHE_TTL, tags=[_poll_tag(poll.id)])
+
 # --- FUNCIONALIDADES DE DASHBOARD E LISTAGEM ---
 
 def get_recent_public_polls(db: Session, limit: int = 10):
@@ -58,7 +229,17 @@ def get_recent_public_polls(db: Session, limit: int = 10):
     ).order_by(models.Poll.id.desc()).limit(limit).all()
 
 def delete_poll(db: Session, poll_id: int):
+    poll = db.query(models.Poll).filter(models.Poll.id == poll_id).first()
+    if poll:
+        invalidate_poll_cache(poll)
+
     # Exclusão em cascata manual
+    db.query(models.VoteRollup).filter(models.VoteRollup.poll_id == poll_id).delete()
+    db.query(models.PollTally).filter(models.PollTally.poll_id == poll_id).delete()
+    db.query(models.ArchivedVoteChunk).filter(models.ArchivedVoteChunk.poll_id == poll_id).delete()
+    db.query(models.VoteIPCounter).filter(models.VoteIPCounter.poll_id == poll_id).delete()
+    db.query(models.OptionVoteShard).filter(models.OptionVoteShard.poll_id == poll_id).delete()
+    db.query(models.PollResultSnapshot).filter(models.PollResultSnapshot.poll_id == poll_id).delete()
     db.query(models.Vote).filter(models.Vote.poll_id == poll_id).delete()
     db.query(models.Option).filter(models.Option.poll_id == poll_id).delete()
     db.query(models.Poll).filter(models.Poll.id == poll_id).delete()
@@ -68,8 +249,15 @@ def update_poll_deadline(db: Session, poll_id: int, new_deadline):
     poll = db.query(models.Poll).filter(models.Poll.id == poll_id).first()
     if poll:
         poll.deadline = new_deadline
+        # Reabre; o agendador encerra de novo quando o prazo vencer (na hora, se já passou)
+        poll.closed = False
         db.commit()
         db.refresh(poll)
+        # Prazo novo: o resultado final (se havia) deixa de valer
+        discard_results_snapshot(db, poll.id)
+        invalidate_poll_cache(poll)
+        if new_deadline:
+            deadlines.scheduler.schedule(poll.id, new_deadline)
     return poll
 
 def update_user_password(db: Session, user_id: int, new_hashed_password: str):
@@ -88,6 +276,120 @@ def get_all_public_polls(db: Session):
         models.Poll.archived == False
     ).all()
 
+def get_public_poll_cards(db: Session):
+    """
+    Enquetes públicas com total de votos e autor, prontas para os cards da home.
+    Fica em cache (HOME_CACHE_TTL) e é invalidada quando alguma enquete muda.
+    """
+    def load():
+        polls = db.query(models.Poll).options(joinedload(models.Poll.creator)).filter(
+            models.Poll.is_public == True,
+            models.Poll.archived == False
+        ).all()
+        totals = get_vote_totals(db, [p.id for p in polls])
+        for p in polls:
+            p.vote_count = totals.get(p.id, 0)
+        return [schemas.PollCard.model_validate(p) for p in polls]
+
+    return cache.get_or_set("home:public-polls", load, ttl=HOME_CACHE_TTL, tags=[HOME_CACHE_TAG])
+
+# Páginas do carrossel "Em Alta": descartadas quando a tarefa do ranking roda (ranking.py)
+TRENDING_CACHE_TAG = "home:trending"
+
+def count_public_polls(db: Session) -> int:
+    def load():
+        return db.query(func.count(models.Poll.id)).filter(
+            models.Poll.is_public == True,
+            models.Poll.archived == False
+        ).scalar()
+
+    return cache.get_or_set("home:public-count", load, ttl=HOME_CACHE_TTL, tags=[HOME_CACHE_TAG])
+
+# Ordenações dos carrosséis da home (ver partials.py)
+CARD_SORTS = ("latest", "popular", "oldest")
+
+def get_poll_card_page(db: Session, sort: str, cursor: int | None = None, limit: int = HOME_PAGE_SIZE):
+    """
+    Uma página de cards públicos, paginada por chave (keyset): o cursor é o id
+    do último card já exibido, então o custo não depende de quantas páginas vieram antes.
+    Retorna (cards, próximo cursor ou None).
+    """
+    # "Em Alta" só mostra enquetes que ainda aceitam votos (closed é ligado pelo agendador de prazos)
+    open_only = sort == "popular"
+
+    # Cursor que não é um card da listagem (excluída, arquivada, encerrada, privada ou inventado):
+    # não ganha entrada no cache; no "popular" a listagem termina, porque sem a
+    # pontuação do cursor não há como saber quais cards já foram exibidos
+    listed_cursor = True
+    if cursor is not None:
+        cursor_query = db.query(models.Poll.id).filter(
+            models.Poll.id == cursor,
+            models.Poll.is_public == True,
+            models.Poll.archived == False
+        )
+        if open_only:
+            cursor_query = cursor_query.filter(models.Poll.closed == False)
+        listed_cursor = cursor_query.first() is not None
+        if not listed_cursor and sort == "popular":
+            return [], None
+
+    def load():
+        Poll = models.Poll
+        query = db.query(Poll).options(joinedload(Poll.creator)).filter(
+            Poll.is_public == True,
+            Poll.archived == False
+        )
+        if open_only:
+            query = query.filter(Poll.closed == False)
+        if sort == "latest":
+            if cursor is not None:
+                query = query.filter(Poll.id < cursor)
+            query = query.order_by(Poll.id.desc())
+        elif sort == "oldest":
+            if cursor is not None:
+                query = query.filter(Poll.id > cursor)
+            query = query.order_by(Poll.id.asc())
+        else:
+            if cursor is not None:
+                # Compara com a pontuação guardada no banco (subconsulta), sem
+                # levar o float no cursor; se o ranking mudou, segue a posição atual
+                score = db.query(Poll.popularity_score).filter(Poll.id == cursor).scalar_subquery()
+                query = query.filter(or_(
+                    Poll.popularity_score < score,
+                    and_(Poll.popularity_score == score, Poll.id < cursor)
+                ))
+            query = query.order_by(Poll.popularity_score.desc(), Poll.id.desc())
+
+        polls = query.limit(limit + 1).all()
+        has_more = len(polls) > limit
+        polls = polls[:limit]
+        totals = get_vote_totals(db, [p.id for p in polls])
+        for p in polls:
+            p.vote_count = totals.get(p.id, 0)
+        cards = [schemas.PollCard.model_validate(p) for p in polls]
+        return cards, (cards[-1].id if has_more else None)
+
+    if not listed_cursor:
+        return load()
+    tags = [HOME_CACHE_TAG, TRENDING_CACHE_TAG] if sort == "popular" else [HOME_CACHE_TAG]
+    return cache.get_or_set(f"home:page:{sort}:{cursor or 0}:{limit}", load, ttl=HOME_CACHE_TTL, tags=tags)
+
+# --- ESTADO DAS TAREFAS PERIÓDICAS ---
+
+def get_job_state(db: Session, name: str):
+    state = db.get(models.JobState, name)
+    return state.value if state else None
+
+def set_job_state(db: Session, name: str, value):
+    """
+    Grava o valor na sessão atual (o commit fica por conta de quem chama).
+    """
+    state = db.get(models.JobState, name)
+    if state is None:
+        state = models.JobState(name=name)
+        db.add(state)
+    state.value = str(value)
+
 # --- FUNCIONALIDADES DE VERIFICAÇÃO DE E-MAIL ---
 
 def activate_user(db: Session, user: models.User):
@@ -125,6 +427,8 @@ def update_user_details(
             
         db.commit()
         db.refresh(user)
+        # Nome e foto do autor fazem parte das enquetes e cards em cache
+        invalidate_user_polls_cache(db, user.id)
     return user
 
 def delete_expired_unverified_users(db: Session):
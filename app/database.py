@@ -1,28 +1,36 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from fastapi.templating import Jinja2Templates
 import os
 from urllib.parse import quote_plus  # <--- 1. IMPORTAR ISTO
 
-templates = Jinja2Templates(directory="templates")
-templates.env.globals["app_version"] = os.environ.get("APP_VERSION", "dev-local")
+# Os templates agora vivem em templating.py (mantido aqui por compatibilidade)
+from templating import templates
 
-# 2. CODIFICAR USUÁRIO E SENHA
-# Isso transforma caracteres como '@' em '%40', permitindo que o banco entenda corretamente
-db_user = quote_plus(os.getenv('DB_USER'))
-db_password = quote_plus(os.getenv('DB_PASSWORD'))
-db_host = os.getenv('DB_HOST')
-db_name = os.getenv('DB_NAME')
+# DATABASE_URL permite apontar para outro banco (ex: SQLite nos benchmarks)
+DATABASE_URL = os.getenv("DATABASE_URL")
 
-DATABASE_URL = (
-    f"mysql+mysqlconnector://"
-    f"{db_user}:{db_password}@" # <--- 3. USAR AS VARIÁVEIS CODIFICADAS
-    f"{db_host}/{db_name}"
-    "?charset=utf8mb4"
-)
+if not DATABASE_URL:
+    # 2. CODIFICAR USUÁRIO E SENHA
+    # Isso transforma caracteres como '@' em '%40', permitindo que o banco entenda corretamente
+    db_user = quote_plus(os.getenv('DB_USER'))
+    db_password = quote_plus(os.getenv('DB_PASSWORD'))
+    db_host = os.getenv('DB_HOST')
+    db_name = os.getenv('DB_NAME')
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+    DATABASE_URL = (
+        f"mysql+mysqlconnector://"
+        f"{db_user}:{db_password}@" # <--- 3. USAR AS VARIÁVEIS CODIFICADAS
+        f"{db_host}/{db_name}"
+        "?charset=utf8mb4"
+    )
+
+engine_options = {"pool_pre_ping": True}
+if DATABASE_URL.startswith("sqlite"):
+    # As rotas síncronas rodam num threadpool
+    engine_options["connect_args"] = {"check_same_thread": False}
+
+engine = create_engine(DATABASE_URL, **engine_options)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -0,0 +1,173 @@
+import os
+import heapq
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+from tasks import leader_service
+
+logger = logging.getLogger(__name__)
+
+# O líder guarda num heap os prazos que vencem dentro dessa janela (segundos),
+# carregados pelo índice (closed, deadline), e encerra cada enquete na hora exata
+DEADLINE_LOOKAHEAD = int(os.getenv("DEADLINE_LOOKAHEAD", 3600))
+# Recarga do heap: traz a janela seguinte e prazos alterados em outros workers
+DEADLINE_REFRESH_INTERVAL = int(os.getenv("DEADLINE_REFRESH_INTERVAL", 60))
+
+_CLOSE = -1
+_close_hooks = []
+
+def close_hook(delay: int = 0):
+    """
+    Registra uma função (db, poll) chamada quando o prazo da enquete vence,
+    `delay` segundos depois do encerramento (ex: esperar votos em andamento).
+    """
+    def decorator(func):
+        _close_hooks.append((func, delay))
+        return func
+    return decorator
+
+def is_expired(poll, now: datetime | None = None) -> bool:
+    """
+    Prazo vencido. Também olha o deadline, porque `closed` pode chegar
+    alguns instantes depois (enquete em cache ou prazo alterado em outro worker).
+    """
+    now = now or datetime.now()
+    return bool(poll.closed) or bool(poll.deadline and now > poll.deadline)
+
+def close_poll(db: Session, poll_id: int) -> models.Poll | None:
+    """
+    Marca a enquete como encerrada se o prazo dela já passou
+    (o prazo pode ter mudado desde que entrou no heap).
+    """
+    result = db.execute(update(models.Poll).where(
+        models.Poll.id == poll_id,
+        models.Poll.closed == False,
+        models.Poll.deadline <= datetime.now()
+    ).values(closed=True))
+    if result.rowcount != 1:
+        db.rollback()
+        return None
+    db.commit()
+    return db.get(models.Poll, poll_id)
+
+class DeadlineScheduler:
+    """
+    Heap de (quando, poll_id, hook): hook = _CLOSE encerra a enquete; os demais
+    são ganchos com atraso. Só roda no worker líder (ver tasks.leader_service).
+    """
+    def __init__(self):
+        self._heap = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wake = None
+
+    def schedule(self, poll_id: int, when: datetime, hook: int = _CLOSE):
+        """
+        Pode ser chamado de qualquer thread. Fora do líder não faz nada:
+        lá o prazo novo chega pela próxima recarga.
+        """
+        loop = self._loop
+        if loop is None:
+            return
+        with self._lock:
+            heapq.heappush(self._heap, (when, poll_id, hook))
+        loop.call_soon_threadsafe(self._wake.set)
+
+    def reload(self, db: Session):
+        horizon = datetime.now() + timedelta(seconds=DEADLINE_LOOKAHEAD)
+        rows = db.query(models.Poll.deadline, models.Poll.id).filter(
+            models.Poll.closed == False,
+            models.Poll.deadline.isnot(None),
+            models.Poll.deadline <= horizon
+        ).order_by(models.Poll.deadline).all()
+        with self._lock:
+            # Os ganchos com atraso só existem em memória; os encerramentos vêm do banco
+            entries = [entry for entry in self._heap if entry[2] != _CLOSE]
+            entries.extend((deadline, poll_id, _CLOSE) for deadline, poll_id in rows)
+            heapq.heapify(entries)
+            self._heap = entries
+
+    def _pop_due(self, now: datetime) -> list:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap))
+        return due
+
+    def _seconds_to_next(self) -> float | None:
+        with self._lock:
+            if not self._heap:
+                return None
+            return (self._heap[0][0] - datetime.now()).total_seconds()
+
+    def _fire(self, db: Session, due: list):
+        closed = 0
+        for _, poll_id, hook in due:
+            try:
+                if hook == _CLOSE:
+                    poll = close_poll(db, poll_id)
+                    if poll is None:
+                        continue
+                    closed += 1
+                    for index, (func, delay) in enumerate(_close_hooks):
+                        if delay:
+                            self.schedule(poll_id, datetime.now() + timedelta(seconds=delay), index)
+                        else:
+                            func(db, poll)
+                else:
+                    poll = db.get(models.Poll, poll_id)
+                    if poll is not None and poll.closed:
+                        _close_hooks[hook][0](db, poll)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Erro ao encerrar a enquete {poll_id}: {e}")
+        if closed:
+            logger.info(f"⏰ Prazos: {closed} enquetes encerradas.")
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._loop = loop
+        try:
+            next_reload = 0
+            while True:
+                self._wake.clear()
+                if loop.time() >= next_reload:
+                    await asyncio.to_thread(_with_session, self.reload)
+                    next_reload = loop.time() + DEADLINE_REFRESH_INTERVAL
+                due = self._pop_due(datetime.now())
+                if due:
+                    await asyncio.to_thread(_with_session, self._fire, due)
+                    continue
+
+                timeout = next_reload - loop.time()
+                until_next = self._seconds_to_next()
+                if until_next is not None:
+                    timeout = min(timeout, until_next)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._loop = None
+            with self._lock:
+                self._heap = []
+
+def _with_session(func, *args):
+    db = SessionLocal()
+    try:
+        return func(db, *args)
+    finally:
+        db.close()
+
+scheduler = DeadlineScheduler()
+
+@leader_service("prazos")
+async def run_scheduler():
+    await scheduler.run()
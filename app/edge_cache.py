@@ -0,0 +1,73 @@
+import os
+import logging
+import threading
+import urllib.request
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Modo "cache na borda" da página de votação (POLL_EDGE_CACHE=1): o HTML é o mesmo
+# para todos os visitantes e pode ser guardado por um proxy (ex: micro-cache do nginx).
+# O estado de cada visitante (logado? já votou?) vem de /polls/{link}/state.
+POLL_EDGE_CACHE = os.getenv("POLL_EDGE_CACHE", "0") == "1"
+EDGE_CACHE_MAX_AGE = int(os.getenv("EDGE_CACHE_MAX_AGE", 60))
+
+# Base para as requisições PURGE enviadas quando uma enquete muda
+# (ex: http://nginx/purge -> PURGE http://nginx/purge/polls/<link>). Vazio = sem purge HTTP.
+EDGE_PURGE_URL = os.getenv("EDGE_PURGE_URL", "").rstrip("/")
+EDGE_PURGE_TIMEOUT = 2
+
+_purge_hooks = []
+
+def purge_hook(func):
+    """
+    Registra uma função chamada com a enquete sempre que o cache dela é invalidado
+    (ex: integração com a API de purge de uma CDN).
+    """
+    _purge_hooks.append(func)
+    return func
+
+def surrogate_key(poll) -> str:
+    return f"poll-{poll.id}"
+
+def cache_headers(poll) -> dict:
+    """
+    Cabeçalhos da página compartilhada. A validade nunca passa do prazo da
+    enquete, para o proxy não continuar servindo o formulário depois do encerramento.
+    """
+    max_age = EDGE_CACHE_MAX_AGE
+    if poll.deadline and not poll.archived:
+        remaining = int((poll.deadline - datetime.now()).total_seconds())
+        if remaining > 0:
+            max_age = max(1, min(max_age, remaining))
+    return {
+        "Cache-Control": f"public, max-age={max_age}",
+        "Surrogate-Key": surrogate_key(poll),
+    }
+
+def purge_poll(poll):
+    """
+    Chamado por crud.invalidate_poll_cache: avisa os proxies que a página mudou.
+    """
+    for hook in _purge_hooks:
+        try:
+            hook(poll)
+        except Exception as e:
+            logger.error(f"Erro no purge da enquete {poll.id} ({hook.__name__}): {e}")
+
+def _send_purge(url: str, key: str):
+    request = urllib.request.Request(url, method="PURGE", headers={"Surrogate-Key": key})
+    try:
+        urllib.request.urlopen(request, timeout=EDGE_PURGE_TIMEOUT).close()
+    except Exception as e:
+        # 404 = a página não estava no cache; outros erros só ficam no log (o TTL é curto)
+        if getattr(e, "code", None) != 404:
+            logger.warning(f"⚠️ Purge falhou em {url}: {e}")
+
+@purge_hook
+def purge_http(poll):
+    if not EDGE_PURGE_URL:
+        return
+    # Em segundo plano: a rota que alterou a enquete não espera o proxy
+    for path in (f"/polls/{poll.public_link}", f"/polls/{poll.public_link}/results", f"/polls/{poll.public_link}/og.jpg"):
+        threading.Thread(target=_send_purge, args=(EDGE_PURGE_URL + path, surrogate_key(poll)), daemon=True).start()
@@ -0,0 +1,51 @@
+# Configuração de produção: gunicorn gerenciando N workers uvicorn
+import os
+import shutil
+import multiprocessing
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Equivalente a --proxy-headers --forwarded-allow-ips do uvicorn: o IP do cliente vem do
+# X-Forwarded-For só quando a conexão chega de um desses endereços (o proxy na frente,
+# ex: FORWARDED_ALLOW_IPS=172.18.0.2). "*" confiaria em qualquer um, e o cliente poderia forjar o IP.
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+# Diretório onde cada worker grava suas métricas do Prometheus. Precisa estar no
+# ambiente antes de qualquer import do prometheus_client (o startup já o importa
+# no master, e os workers herdam o modo escolhido no fork)
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/enquetes-metrics")
+
+def on_starting(server):
+    """
+    Roda uma única vez no processo master, antes dos workers existirem:
+    aguarda o banco e faz o bootstrap (tabelas + admin padrão).
+    Os workers herdam a variável de ambiente e pulam essa etapa.
+    """
+    # Métricas da execução anterior saem antes de o prometheus_client ser carregado
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    import startup
+    from database import engine
+
+    if startup.wait_for_database_sync():
+        startup.bootstrap_database()
+        startup.mark_bootstrapped()
+
+    # Não deixa conexões abertas do master serem herdadas pelos workers no fork
+    engine.dispose()
+
+def child_exit(server, worker):
+    # Remove os gauges "live" do worker que morreu
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,35 @@
+import os
+import hmac
+import hashlib
+import ipaddress
+
+from auth_utils import SECRET_KEY
+
+# Chave do HMAC usado nas enquetes anônimas (padrão: derivada da SECRET_KEY).
+# Trocar a chave faz a checagem de IP "esquecer" os votos já registrados nessas enquetes.
+VOTER_IP_HASH_KEY = os.getenv("VOTER_IP_HASH_KEY", SECRET_KEY).encode()
+
+VOTER_KEY_SIZE = 16
+
+def pack_ip(ip: str) -> bytes:
+    """
+    IP em 16 bytes fixos (IPv4 vira IPv4-mapeado em IPv6, ::ffff:a.b.c.d).
+    Valores que não são IP (cabeçalho forjado, "testclient") viram um hash do texto.
+    """
+    try:
+        address = ipaddress.ip_address(ip.strip())
+    except ValueError:
+        return hashlib.blake2b(ip.encode(), digest_size=VOTER_KEY_SIZE).digest()
+    if address.version == 4:
+        address = ipaddress.IPv6Address(f"::ffff:{address}")
+    return address.packed
+
+def voter_key(ip: str, anonymous: bool = False) -> bytes:
+    """
+    Valor gravado em Vote.voter_ip: o IP compactado ou, em enquetes
+    anônimas, um HMAC dele (não dá para recuperar o IP a partir do banco).
+    """
+    packed = pack_ip(ip)
+    if anonymous:
+        return hmac.new(VOTER_IP_HASH_KEY, packed, hashlib.sha256).digest()[:VOTER_KEY_SIZE]
+    return packed
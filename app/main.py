@@ -1,30 +1,39 @@
 import asyncio
-import time
 import logging
 from contextlib import asynccontextmanager
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from database import engine, Base, get_db, SessionLocal
 from fastapi import FastAPI, Request, Depends, Cookie, Form, File, UploadFile, BackgroundTasks
 from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import text 
-import shutil
+from sqlalchemy.orm import Session, selectinload
 import os
 import uuid
 from datetime import datetime
-import io
-from PIL import Image
-from database import templates
+from templating import templates
 
 # Imports do sistema
 from auth_utils import verify_token, get_password_hash, verify_password 
 from database import engine, Base, get_db
 
-import auth, poll, admin 
+import auth, poll, admin, partials
 import models, crud, schemas
+import startup
+import ranking  # registra a tarefa do ranking de popularidade
+import rollups  # registra a tarefa de agregação dos votos por tempo
+import archival  # registra a tarefa de arquivamento dos votos
+import vote_counters  # registra a tarefa de compactação dos contadores
+import result_snapshots  # registra a tarefa dos resultados finais
+import deadlines  # registra o agendador de prazos (só no líder)
+import metrics
+import profiler
+import uploads
+import storage
+from ratelimit import RateLimitMiddleware
+from tasks import periodic_job, background_jobs
 
 # Import da função de e-mail
 from email_utils import send_change_email_request
@@ -33,93 +42,62 @@ from email_utils import send_change_email_request
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Instrumentação (Prometheus): consultas SQL e renderização de templates
+metrics.instrument_engine(engine)
+metrics.instrument_templates(templates)
+
 # Pasta de uploads
-UPLOAD_DIR = "static/uploads"
+UPLOAD_DIR = uploads.UPLOAD_DIR
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def create_default_admin():
-    try:
-        db = next(get_db())    
-        any_user = db.query(models.User).first()
-        
-        if not any_user:
-            logger.info("--- TABELA VAZIA DETECTADA: CRIANDO ADMIN PADRÃO ---")
-            hashed = get_password_hash("admin")
-            admin_user = models.User(
-                first_name="Super",
-                last_name="Admin",
-                email="admin@admin",
-                hashed_password=hashed,
-                is_verified=True, 
-                is_admin=True,    
-                is_blocked=False
-            )
-            db.add(admin_user)
-            db.commit()
-            logger.info("--- ADMIN CRIADO: admin@admin / admin ---")
-    except Exception as e:
-        logger.error(f"Erro ao criar admin padrão: {e}")
-
-# --- TAREFA EM SEGUNDO PLANO (LOOP INFINITO) ---
-async def periodic_cleanup_task():
+# --- TAREFA EM SEGUNDO PLANO (RODA SÓ NO WORKER LÍDER) ---
+@periodic_job("limpeza_usuarios", 3600)
+def cleanup_expired_users(db: Session):
     """
-    Roda infinitamente a cada 1 hora para limpar usuários expirados.
+    Roda a cada 1 hora para limpar usuários expirados.
     """
-    while True:
-        try:
-            db = SessionLocal()
-            # Chama a função que criamos no crud.py
-            count = crud.delete_expired_unverified_users(db)
-            if count > 0:
-                logger.info(f"🧹 Limpeza Automática: {count} usuários expirados foram removidos.")
-            db.close()
-        except Exception as e:
-            logger.error(f"Erro na tarefa de limpeza automática: {e}")
-        
-        # Espera 1 hora (3600 segundos) antes de verificar de novo
-        await asyncio.sleep(3600)
+    count = crud.delete_expired_unverified_users(db)
+    if count > 0:
+        logger.info(f"🧹 Limpeza Automática: {count} usuários expirados foram removidos.")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # --- LÓGICA DE RETRY (AGUARDAR BANCO) ---
-    max_retries = 30
-    retry_interval = 2
-    logger.info("⏳ Iniciando verificação de conexão com o Banco de Dados...")
-    for i in range(max_retries):
-        try:
-            with engine.connect() as connection:
-                connection.execute(text("SELECT 1"))
-            logger.info("✅ Banco de Dados conectado com sucesso!")
-            break
-        except Exception as e:
-            logger.warning(f"⚠️ Banco indisponível. Tentativa {i+1}/{max_retries}...")
-            time.sleep(retry_interval)
-    else:
-        logger.error("❌ Falha crítica: Não foi possível conectar ao banco.")
+    # --- AGUARDA O BANCO SEM BLOQUEAR O EVENT LOOP ---
+    await startup.wait_for_database()
 
-    # Startup normal
-    try:
-        models.Base.metadata.create_all(bind=engine)
-        create_default_admin()
-        
-        # --- INICIA A TAREFA DE LIMPEZA EM SEGUNDO PLANO ---
-        # Isso dispara o loop sem travar a inicialização do servidor
-        asyncio.create_task(periodic_cleanup_task())
-        # ---------------------------------------------------
-        
-    except Exception as e:
-        logger.error(f"Erro durante a inicialização das tabelas: {e}")
+    # Com gunicorn o master já fez o bootstrap antes de criar os workers
+    if not startup.already_bootstrapped():
+        await asyncio.to_thread(startup.bootstrap_database)
+
+    # --- INICIA A ELEIÇÃO DO WORKER QUE RODA AS TAREFAS PERIÓDICAS ---
+    background_jobs.start()
 
     yield
 
+    await background_jobs.stop()
+
 app = FastAPI(lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Recusa corpos maiores que MAX_REQUEST_BYTES antes de o formulário ir para o disco
+app.add_middleware(uploads.BodySizeLimitMiddleware)
+# Limita por IP as rotas caras (voto, login, cadastro, recuperação de senha)
+app.add_middleware(RateLimitMiddleware)
+# Latência por rota, requisições em andamento e consultas por requisição (/metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Modo de depuração (SQL_PROFILE=1): lista as consultas de cada requisição e acusa N+1
+if profiler.SQL_PROFILE:
+    profiler.install(engine)
+    app.add_middleware(profiler.SQLProfilerMiddleware)
+
 # Incluindo Rotas
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(poll.router, prefix="/polls", tags=["polls"])
 app.include_router(admin.router, prefix="/admin", tags=["admin"])
+app.include_router(partials.router, prefix="/partials", tags=["partials"])
+app.include_router(metrics.router)
 
 # --- MANIPULADOR DE ERRO 404 ---
 @app.exception_handler(404)
@@ -140,6 +118,20 @@ async def custom_404_handler(request: Request, exc: StarletteHTTPException):
         
     return templates.TemplateResponse("404.html", {"request": request, "user": user}, status_code=404)
 
+# --- IMAGENS ENVIADAS (ver storage.py) ---
+@app.get("/media/{key:path}")
+def media_redirect(key: str):
+    """
+    Redireciona para o arquivo no backend de uploads (URL assinada no S3 privado):
+    a imagem em si nunca passa pela aplicação.
+    """
+    if not storage.valid_key(key):
+        raise StarletteHTTPException(404)
+    return RedirectResponse(storage.storage.redirect_url(key), status_code=302, headers={
+        # Menos que a validade da assinatura, para o navegador não reaproveitar uma URL vencida
+        "Cache-Control": f"public, max-age={storage.S3_PRESIGN_EXPIRES // 2}"
+    })
+
 # --- CORREÇÃO 1: Rota /login redireciona para Home ---
 @app.get("/login")
 def login_redirect():
@@ -161,21 +153,11 @@ def read_root(
         if email:
             user = crud.get_user_by_email(db, email)
 
-    # 1. Busca TODAS as enquetes públicas
-    all_polls = crud.get_all_public_polls(db)
-    
-    # 2. Calcula contagem de votos para todas (necessário para ordenar por popularidade)
-    # Nota: Em sistemas muito grandes, isso deve ser feito via SQL Count/Group By.
-    # Para o seu escopo atual, Python resolve bem.
-    for p in all_polls:
-        p.vote_count = db.query(models.Vote).filter(models.Vote.poll_id == p.id).count()
-
-    total_count = len(all_polls)
+    # Total de enquetes públicas (só decide se mostra o campo de busca)
+    total_count = crud.count_public_polls(db)
     
     # Variáveis para o template
-    polls_latest = []
-    polls_popular = []
-    polls_oldest = []
+    pages = {}
     search_results = []
     is_search = False
 
@@ -183,17 +165,12 @@ def read_root(
         # SE TIVER BUSCA: Filtra pelo título e mostra grid único
         is_search = True
         search_term = q.lower()
-        search_results = [p for p in all_polls if search_term in p.title.lower()]
+        search_results = [p for p in crud.get_public_poll_cards(db) if search_term in p.title.lower()]
     else:
-        # SE NÃO TIVER BUSCA: Prepara os 3 Carrosséis
-        # a) Últimas: Ordena por ID descrescente
-        polls_latest = sorted(all_polls, key=lambda x: x.id, reverse=True)
-        
-        # b) Mais Votadas: Ordena por vote_count descrescente
-        polls_popular = sorted(all_polls, key=lambda x: x.vote_count, reverse=True)
-        
-        # c) Mais Antigas: Ordena por ID crescente
-        polls_oldest = sorted(all_polls, key=lambda x: x.id, reverse=False)
+        # SE NÃO TIVER BUSCA: só a primeira página de cada carrossel
+        # (Últimas, Em Alta e Mais Antigas); as seguintes vêm de /partials/polls ao rolar
+        for sort in crud.CARD_SORTS:
+            pages[sort] = crud.get_poll_card_page(db, sort)
 
     return templates.TemplateResponse("login.html", {
         "request": request, 
@@ -204,9 +181,7 @@ def read_root(
         "q": q,
         "is_search": is_search,
         "search_results": search_results,
-        "polls_latest": polls_latest,
-        "polls_popular": polls_popular,
-        "polls_oldest": polls_oldest
+        "pages": pages
     })
 
 # --- ROTA DE REGISTRO ---
@@ -233,32 +208,15 @@ def dashboard(
     if not user: return RedirectResponse("/", status_code=303)
     
     # Busca as enquetes do usuário
-    user_polls = db.query(models.Poll).filter(models.Poll.creator_id == user.id).order_by(models.Poll.id.desc()).all()
+    user_polls = db.query(models.Poll).filter(
+        models.Poll.creator_id == user.id
+    ).order_by(models.Poll.id.desc()).all()
     
-    # --- LÓGICA NOVA: Calcular estatísticas para os Modais de Resultados ---
+    # Total de votos da tabela numa consulta só; o detalhe por opção
+    # é carregado quando o modal de resultados é aberto (/partials/dashboard/{id}/results)
+    totals = crud.get_vote_totals(db, [p.id for p in user_polls])
     for p in user_polls:
-        # 1. Conta o total de votos
-        votes = db.query(models.Vote).filter(models.Vote.poll_id == p.id).all()
-        p.vote_count = len(votes)
-        
-        # 2. Calcula porcentagem por opção
-        options = db.query(models.Option).filter(models.Option.poll_id == p.id).all()
-        summary = []
-        for opt in options:
-            opt_votes = sum(1 for v in votes if v.option_id == opt.id)
-            percent = 0
-            if p.vote_count > 0:
-                percent = round((opt_votes / p.vote_count) * 100, 1)
-            
-            summary.append({
-                "text": opt.text,
-                "votes": opt_votes,
-                "percent": percent
-            })
-        
-        # Anexa o resumo na enquete para o template ler
-        p.results_summary = summary
-    # ---------------------------------------------------------------------
+        p.vote_count = totals.get(p.id, 0)
 
     return templates.TemplateResponse("dashboard.html", {
         "request": request, 
@@ -269,14 +227,14 @@ def dashboard(
     })
 
 @app.get("/create_poll", response_class=HTMLResponse)
-def create_poll_page(request: Request, db: Session = Depends(get_db)):
+def create_poll_page(request: Request, db: Session = Depends(get_db), error: str = None):
     token = request.cookies.get("access_token")
     if not token: return RedirectResponse("/", status_code=303)
     email = verify_token(token)
     if not email: return RedirectResponse("/", status_code=303)
     user = crud.get_user_by_email(db, email)
     
-    return templates.TemplateResponse("create_poll.html", {"request": request, "user": user})
+    return templates.TemplateResponse("create_poll.html", {"request": request, "user": user, "error": error})
 
 @app.post("/create_poll")
 async def create_poll_action(
@@ -299,64 +257,15 @@ async def create_poll_action(
 
     image_path = None
     
-    # --- NOVA LÓGICA DE OTIMIZAÇÃO DE IMAGEM ---
+    # Capa: lida em blocos com limite de tamanho e de pixels, depois comprimida (ver uploads.py)
     if image_file and image_file.filename:
         try:
-            # 1. Lê o arquivo da memória
-            contents = await image_file.read()
-            img = Image.open(io.BytesIO(contents))
-
-            # 2. Converte para RGB (Obrigatório para salvar PNG transparente como JPG)
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-
-            # 3. Redimensiona se for muito grande (Max 1200px de largura é ideal para WhatsApp)
-            # max_width = 1200
-            # if img.width > max_width:
-            #     ratio = max_width / float(img.width)
-            #     new_height = int((float(img.height) * float(ratio)))
-            #     img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-
-            # 3. Redimensiona para resolução FIXA (686x386)
-            # Isso garante o tamanho exato, mas pode "esticar" ou "apertar" a imagem
-            # se ela não tiver a mesma proporção.
-            img = img.resize((686, 386), Image.Resampling.LANCZOS)
-
-            # 4. Loop de Compressão para garantir < 100KB
-            quality = 90
-            output = io.BytesIO()
-            
-            while True:
-                output.seek(0)
-                output.truncate()
-                # Salva no buffer com a qualidade atual
-                img.save(output, format="JPEG", quality=quality, optimize=True)
-                
-                # Verifica o tamanho em KB
-                size_kb = output.tell() / 1024
-                
-                # --- ALTERAÇÃO AQUI (De 100 para 950) ---
-                if size_kb <= 95 or quality <= 20: 
-                    break
-                
-                # Se ainda estiver maior que 950kb, reduz a qualidade
-                quality -= 10
-
-            # 5. Gera nome único e Salva no disco
-            # Forçamos a extensão .jpg, não importa o original
-            safe_filename = f"{uuid.uuid4()}.jpg"
-            file_location = os.path.join(UPLOAD_DIR, safe_filename)
-            
-            with open(file_location, "wb") as f:
-                f.write(output.getvalue())
-                
-            image_path = f"/static/uploads/{safe_filename}"
-            
+            image_path = await run_in_threadpool(uploads.save_poll_cover, image_file)
+        except uploads.UploadError as e:
+            return RedirectResponse(f"/create_poll?error={e}", status_code=303)
         except Exception as e:
             logger.error(f"Erro ao processar imagem: {e}")
-            # Se der erro na compressão, segue sem imagem ou trata o erro
-            pass
-    # ---------------------------------------------
+            # Se der erro na compressão, segue sem imagem
 
     deadline_dt = None
     if deadline:
@@ -411,6 +320,8 @@ def update_name(
     user.first_name = first_name
     user.last_name = last_name
     db.commit()
+    # O nome do autor aparece nas enquetes em cache
+    crud.invalidate_user_polls_cache(db, user.id)
     
     return RedirectResponse("/my_profile?success=Nome atualizado com sucesso.", status_code=303)
 
@@ -427,20 +338,16 @@ def upload_avatar(
     if not avatar.content_type.startswith("image/"):
         return RedirectResponse("/my_profile?error=O arquivo deve ser uma imagem.", status_code=303)
 
-    safe_filename = f"avatar_{uuid.uuid4()}_{avatar.filename}"
-    file_location = os.path.join(UPLOAD_DIR, safe_filename)
-    
-    with open(file_location, "wb") as buffer:
-        shutil.copyfileobj(avatar.file, buffer)
+    try:
+        avatar_path = uploads.save_avatar(avatar)
+    except uploads.UploadError as e:
+        return RedirectResponse(f"/my_profile?error={e}", status_code=303)
         
     user = crud.get_user_by_email(db, email)
-    
-    if user.avatar_path and os.path.exists(user.avatar_path.lstrip("/")):
-        try: os.remove(user.avatar_path.lstrip("/"))
-        except: pass
-
-    user.avatar_path = f"/static/uploads/{safe_filename}"
+    # A foto antiga pode ser a mesma de outro usuário: quem apaga é a limpeza de uploads
+    user.avatar_path = avatar_path
     db.commit()
+    crud.invalidate_user_polls_cache(db, user.id)
     
     return RedirectResponse("/my_profile?success=Foto de perfil atualizada.", status_code=303)
 
@@ -469,7 +376,7 @@ def request_email_change(
     db.commit()
 
     base_url = str(request.base_url)
-    background_tasks.add_task(send_change_email_request, new_email, token_str, base_url)
+    background_tasks.add_task(metrics.track_background("email", send_change_email_request), new_email, token_str, base_url)
 
     return RedirectResponse("/my_profile?success=Link de confirmação enviado para o novo e-mail.", status_code=303)
 
@@ -538,6 +445,7 @@ def delete_account(
 
     # 3. Lógica Nova: DESVINCULAR enquetes em vez de apagar
     # Isso atualiza todas as enquetes desse usuário para ficarem sem dono (creator_id = None)
+    crud.invalidate_user_polls_cache(db, user.id)
     db.query(models.Poll).filter(models.Poll.creator_id == user.id).update({"creator_id": None})
 
     # 4. Apaga o Usuário
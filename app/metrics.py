@@ -0,0 +1,195 @@
+import os
+import hmac
+import time
+import functools
+import ipaddress
+from contextvars import ContextVar
+from jinja2 import Template
+from sqlalchemy import event
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, REGISTRY,
+    generate_latest, CONTENT_TYPE_LATEST, multiprocess,
+)
+
+# Quem pode ler /metrics: IPs/redes da lista (ex: o Prometheus na rede do docker,
+# METRICS_ALLOW_IPS=172.16.0.0/12) ou quem mandar "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_ALLOW_IPS = [
+    ipaddress.ip_network(item.strip(), strict=False)
+    for item in os.getenv("METRICS_ALLOW_IPS", "127.0.0.1,::1").split(",") if item.strip()
+]
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+REQUEST_LATENCY = Histogram(
+    "enquetes_http_request_duration_seconds",
+    "Tempo de resposta por rota",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "enquetes_http_requests_in_flight",
+    "Requisições sendo processadas agora",
+    multiprocess_mode="livesum",
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "enquetes_db_queries_per_request",
+    "Quantidade de consultas SQL por requisição",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "enquetes_db_time_per_request_seconds",
+    "Tempo gasto no banco por requisição",
+    ["route"],
+)
+DB_QUERIES_TOTAL = Counter(
+    "enquetes_db_queries_total",
+    "Total de consultas SQL executadas",
+)
+TEMPLATE_RENDER = Histogram(
+    "enquetes_template_render_seconds",
+    "Tempo de renderização dos templates Jinja",
+    ["template"],
+)
+BACKGROUND_QUEUE_DEPTH = Gauge(
+    "enquetes_background_queue_depth",
+    "Tarefas em segundo plano aguardando ou em execução",
+    ["queue"],
+    multiprocess_mode="livesum",
+)
+RATE_LIMIT_REJECTED = Counter(
+    "enquetes_rate_limit_rejected_total",
+    "Requisições recusadas pelo rate limit",
+    ["policy"],
+)
+
+# --- ESTATÍSTICAS DE BANCO POR REQUISIÇÃO ---
+
+class RequestDBStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+_request_db_stats: ContextVar[RequestDBStats | None] = ContextVar("request_db_stats", default=None)
+
+def instrument_engine(engine):
+    """
+    Conta consultas e tempo de banco via eventos do SQLAlchemy.
+    O ContextVar é copiado para o threadpool das rotas síncronas,
+    então cada consulta cai na requisição certa.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERIES_TOTAL.inc()
+        stats = _request_db_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += elapsed
+
+# --- TEMPLATES ---
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            TEMPLATE_RENDER.labels(self.name or "inline").observe(time.perf_counter() - start)
+
+def instrument_templates(templates):
+    templates.env.template_class = TimedTemplate
+
+# --- TAREFAS EM SEGUNDO PLANO ---
+
+def track_background(queue: str, func):
+    """
+    Envolve uma função passada ao BackgroundTasks: a fila cresce ao
+    agendar e diminui quando a tarefa termina.
+    """
+    BACKGROUND_QUEUE_DEPTH.labels(queue).inc()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            BACKGROUND_QUEUE_DEPTH.labels(queue).dec()
+    return wrapper
+
+# --- MIDDLEWARE ---
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope["path"].startswith("/static/"):
+        return "/static"
+    # Evita uma série por URL inexistente (cardinalidade explode)
+    return "unmatched"
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        stats = RequestDBStats()
+        token = _request_db_stats.set(stats)
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            _request_db_stats.reset(token)
+            route = _route_label(scope)
+            REQUEST_LATENCY.labels(scope["method"], route, str(status["code"])).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.queries)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.seconds)
+
+# --- ENDPOINT ---
+
+router = APIRouter()
+
+def metrics_allowed(request: Request) -> bool:
+    if METRICS_TOKEN:
+        authorization = request.headers.get("authorization", "")
+        if hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            return True
+    try:
+        client = ipaddress.ip_address(request.client.host)
+    except (AttributeError, ValueError):
+        return False
+    return any(client in network for network in METRICS_ALLOW_IPS)
+
+@router.get("/metrics", include_in_schema=False)
+def metrics_endpoint(request: Request):
+    # Fora da lista a rota nem aparece (rotas, limites e tarefas não são públicos)
+    if not metrics_allowed(request):
+        return Response(status_code=404)
+    # Com vários workers (gunicorn) cada processo grava seus valores em
+    # PROMETHEUS_MULTIPROC_DIR e a coleta soma tudo (lido aqui, não no import)
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    # CONTENT_TYPE_LATEST já traz o charset; como media_type o Starlette acrescentaria outro
+    return Response(generate_latest(registry), headers={"Content-Type": CONTENT_TYPE_LATEST})
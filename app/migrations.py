@@ -0,0 +1,165 @@
+import os
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, String
+from sqlalchemy.sql import text
+
+import models
+import vote_limit
+import vote_counters
+from ip_keys import voter_key
+
+logger = logging.getLogger(__name__)
+
+# Particionamento opcional (só MySQL): VOTES_PARTITIONS=16 divide votes por HASH(poll_id)
+VOTES_PARTITIONS = int(os.getenv("VOTES_PARTITIONS", 0))
+
+def _column_ddl(column, dialect) -> str:
+    ddl = f"{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect=dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    return ddl
+
+def add_missing_columns(connection):
+    """
+    O create_all só cria tabelas novas. Colunas novas em tabelas já
+    existentes são adicionadas aqui com ALTER TABLE (precisam de server_default
+    quando forem NOT NULL).
+    """
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    preparer = connection.dialect.identifier_preparer
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            logger.info(f"🛠️ Migração: adicionando coluna {table.name}.{column.name}")
+            connection.execute(text(
+                f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {_column_ddl(column, connection.dialect)}"
+            ))
+
+def add_missing_indexes(connection):
+    inspector = inspect(connection)
+    for table in models.Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info(f"🛠️ Migração: criando índice {index.name}")
+                index.create(bind=connection)
+
+def convert_voter_ips(connection, batch: int = 10000):
+    """
+    votes.voter_ip era VARCHAR(45) com o IP em texto; passa a ser VARBINARY(16)
+    (ver ip_keys.py). Converte em lotes numa coluna nova e depois troca as colunas.
+    Roda na transação de run_migrations: se falhar, a conversão é desfeita e recomeça
+    do zero na próxima subida (no MySQL o ADD COLUMN tem commit implícito, então a
+    coluna nova pode já existir e é reaproveitada).
+    """
+    columns = {column["name"]: column for column in inspect(connection).get_columns("votes")}
+    if "voter_ip" not in columns or not isinstance(columns["voter_ip"]["type"], String):
+        return
+
+    logger.info("🛠️ Migração: convertendo votes.voter_ip para VARBINARY(16)")
+    if "voter_ip_bin" not in columns:
+        connection.execute(text("ALTER TABLE votes ADD COLUMN voter_ip_bin VARBINARY(16) NULL"))
+
+    anonymous = {poll_id for (poll_id,) in connection.execute(text("SELECT id FROM polls WHERE anonymous = 1"))}
+    last_id, converted = 0, 0
+    while True:
+        rows = connection.execute(text(
+            "SELECT id, poll_id, voter_ip FROM votes WHERE id > :last_id AND voter_ip_bin IS NULL ORDER BY id LIMIT :batch"
+        ), {"last_id": last_id, "batch": batch}).all()
+        if not rows:
+            break
+        connection.execute(text("UPDATE votes SET voter_ip_bin = :key WHERE id = :id"), [
+            {"id": vote_id, "key": voter_key(voter_ip or "", poll_id in anonymous)} for vote_id, poll_id, voter_ip in rows
+        ])
+        last_id = rows[-1][0]
+        converted += len(rows)
+        if converted % (batch * 10) == 0:
+            logger.info(f"   ... {converted} votos convertidos")
+
+    if connection.dialect.name == "mysql":
+        connection.execute(text("ALTER TABLE votes DROP COLUMN voter_ip, CHANGE voter_ip_bin voter_ip VARBINARY(16) NOT NULL"))
+    else:
+        connection.execute(text("ALTER TABLE votes DROP COLUMN voter_ip"))
+        connection.execute(text("ALTER TABLE votes RENAME COLUMN voter_ip_bin TO voter_ip"))
+    logger.info(f"✅ Migração: {converted} IPs convertidos.")
+
+def backfill_vote_ip_counters(connection):
+    """
+    Preenche vote_ip_counters (ver vote_limit.py) a partir dos votos já existentes.
+    Só roda enquanto a tabela de contadores estiver vazia.
+    """
+    if connection.execute(text("SELECT 1 FROM vote_ip_counters LIMIT 1")).first():
+        return
+    if not connection.execute(text("SELECT 1 FROM votes LIMIT 1")).first():
+        return
+    logger.info("🛠️ Migração: calculando os contadores de votos por IP")
+    count = vote_limit.rebuild(connection)
+    logger.info(f"✅ Migração: {count} contadores de IP criados.")
+
+def backfill_vote_counters(connection):
+    """
+    Preenche option_vote_shards (ver vote_counters.py) com os votos já existentes.
+    Só roda enquanto a tabela de contadores estiver vazia.
+    """
+    if connection.execute(text("SELECT 1 FROM option_vote_shards LIMIT 1")).first():
+        return
+    if not connection.execute(text("SELECT 1 FROM votes LIMIT 1")).first() \
+            and not connection.execute(text("SELECT 1 FROM poll_tallies LIMIT 1")).first():
+        return
+    logger.info("🛠️ Migração: calculando os contadores de votos por opção")
+    count = vote_counters.rebuild(connection)
+    logger.info(f"✅ Migração: {count} contadores de opção criados.")
+
+def close_expired_polls(connection):
+    """
+    Marca como encerradas, de uma vez, as enquetes com prazo vencido antes da
+    coluna polls.closed existir (o agendador cuida das próximas, ver deadlines.py).
+    """
+    result = connection.execute(text(
+        "UPDATE polls SET closed = :closed WHERE closed = :open AND deadline IS NOT NULL AND deadline < :now"
+    ), {"closed": True, "open": False, "now": datetime.now()})
+    if result.rowcount:
+        logger.info(f"✅ Migração: {result.rowcount} enquetes com prazo vencido marcadas como encerradas.")
+
+def partition_votes_table(connection, partitions: int = VOTES_PARTITIONS):
+    """
+    O MySQL exige a coluna de partição em toda chave única (inclusive a primária)
+    e não aceita foreign keys em tabelas particionadas. Por isso a PK de votes
+    vira (id, poll_id) e as FKs saem (delete_poll já apaga os votos antes da enquete).
+    """
+    if connection.dialect.name != "mysql" or partitions <= 0:
+        return
+    partitioned = connection.execute(text(
+        "SELECT COUNT(*) FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'votes' AND PARTITION_NAME IS NOT NULL"
+    )).scalar()
+    if partitioned:
+        return
+
+    logger.info(f"🛠️ Migração: particionando votes em {partitions} partes (pode demorar em tabelas grandes)")
+    for foreign_key in inspect(connection).get_foreign_keys("votes"):
+        connection.execute(text(f"ALTER TABLE votes DROP FOREIGN KEY `{foreign_key['name']}`"))
+    connection.execute(text("ALTER TABLE votes DROP PRIMARY KEY, ADD PRIMARY KEY (id, poll_id)"))
+    connection.execute(text(f"ALTER TABLE votes PARTITION BY HASH(poll_id) PARTITIONS {partitions}"))
+
+def run_migrations(engine):
+    """
+    Migrações leves e idempotentes, executadas no bootstrap depois do create_all.
+    Um erro aqui sobe para bootstrap_database e impede os workers de iniciar.
+    """
+    with engine.begin() as connection:
+        add_missing_columns(connection)
+        convert_voter_ips(connection)
+        add_missing_indexes(connection)
+        backfill_vote_ip_counters(connection)
+        backfill_vote_counters(connection)
+        close_expired_polls(connection)
+        partition_votes_table(connection)
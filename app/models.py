@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, func, Text
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float, LargeBinary, VARBINARY, Index, func, Text
+from sqlalchemy.dialects.mysql import LONGBLOB
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -15,7 +16,7 @@ class User(Base):
     is_blocked = Column(Boolean, default=False)
     
     # --- NOVOS CAMPOS PARA O PERFIL ---
-    avatar_path = Column(String(255), nullable=True)
+    avatar_path = Column(String(255), nullable=True, index=True)
     pending_email = Column(String(255), nullable=True)
     email_verification_token = Column(String(100), nullable=True)
     # ----------------------------------
@@ -39,8 +40,24 @@ class Poll(Base):
     
     archived = Column(Boolean, default=False)
     deadline = Column(DateTime, nullable=True)
-    image_path = Column(String(255), nullable=True)
+    # Marcada pelo agendador de prazos (deadlines.py) no momento em que o prazo vence
+    closed = Column(Boolean, nullable=False, default=False, server_default="0")
+    image_path = Column(String(255), nullable=True, index=True)
+    # Popularidade com decaimento no tempo (atualizada pela tarefa de ranking)
+    popularity_score = Column(Float, nullable=False, default=0, server_default="0", index=True)
+    # Arquivamento (ver archival.py): votos com id <= frozen_up_to_vote_id estão
+    # somados em poll_tallies; com votes_archived eles saíram da tabela votes.
+    # votes_archived sem a marca = desarquivada, votos ainda voltando da tabela fria
+    # (poll_tallies soma só os que faltam voltar)
+    frozen_up_to_vote_id = Column(Integer, nullable=True)
+    votes_archived = Column(Boolean, nullable=False, default=False, server_default="0")
+    # Linhas de contador por opção (ver vote_counters.py); vazio = VOTE_COUNTER_SHARDS
+    counter_shards = Column(Integer, nullable=True)
     creator = relationship("User", back_populates="polls")
+    options = relationship("Option", order_by="Option.id", viewonly=True)
+
+    # Próximos prazos das enquetes ainda abertas (carga do agendador e listagens sem as encerradas)
+    __table_args__ = (Index("ix_polls_closed_deadline", "closed", "deadline"),)
 
 class Option(Base):
     __tablename__ = "options"
@@ -53,5 +70,83 @@ class Vote(Base):
     id = Column(Integer, primary_key=True, index=True)
     poll_id = Column(Integer, ForeignKey("polls.id"), nullable=False)
     option_id = Column(Integer, ForeignKey("options.id"), nullable=False)
-    voter_ip = Column(String(45), nullable=False)
-    voted_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    # IP compactado em 16 bytes, ou HMAC dele em enquetes anônimas (ver ip_keys.py)
+    voter_ip = Column(VARBINARY(16), nullable=False)
+    voted_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (Index("ix_votes_poll_voter_ip", "poll_id", "voter_ip"),)
+
+class JobState(Base):
+    """
+    Estado persistente das tarefas periódicas (ex: último voto já processado).
+    """
+    __tablename__ = "job_state"
+    name = Column(String(100), primary_key=True)
+    value = Column(String(255), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class VoteRollup(Base):
+    """
+    Votos agregados por enquete, opção e intervalo de tempo (minuto ou hora).
+    Mantida pela tarefa em rollups.py; os gráficos de evolução leem só daqui.
+    """
+    __tablename__ = "vote_rollups"
+    poll_id = Column(Integer, ForeignKey("polls.id"), primary_key=True)
+    granularity = Column(String(6), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    option_id = Column(Integer, ForeignKey("options.id"), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class PollTally(Base):
+    """
+    Apuração congelada de uma enquete arquivada (votos até frozen_up_to_vote_id).
+    """
+    __tablename__ = "poll_tallies"
+    poll_id = Column(Integer, ForeignKey("polls.id"), primary_key=True)
+    option_id = Column(Integer, ForeignKey("options.id"), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class ArchivedVoteChunk(Base):
+    """
+    Votos brutos de enquetes arquivadas, em lotes comprimidos (zlib + JSON).
+    """
+    __tablename__ = "archived_vote_chunks"
+    poll_id = Column(Integer, ForeignKey("polls.id"), primary_key=True)
+    chunk = Column(Integer, primary_key=True)
+    vote_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary().with_variant(LONGBLOB, "mysql"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class VoteIPCounter(Base):
+    """
+    Votos registrados por IP em cada enquete, para aplicar MAX_VOTES_PER_IP
+    com um UPDATE condicional (ver vote_limit.py) em vez de COUNT(*) + INSERT.
+    """
+    __tablename__ = "vote_ip_counters"
+    poll_id = Column(Integer, ForeignKey("polls.id"), primary_key=True)
+    voter_ip = Column(VARBINARY(16), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class OptionVoteShard(Base):
+    """
+    Total de votos por opção dividido em várias linhas (shards), para votos
+    simultâneos não disputarem a mesma linha. O total é a soma dos shards.
+    """
+    __tablename__ = "option_vote_shards"
+    poll_id = Column(Integer, ForeignKey("polls.id"), primary_key=True)
+    option_id = Column(Integer, ForeignKey("options.id"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+
+class PollResultSnapshot(Base):
+    """
+    Resultado final de uma enquete encerrada (prazo vencido ou arquivada), gravado
+    uma vez pela tarefa em result_snapshots.py. payload = JSON com total e opções.
+    """
+    __tablename__ = "poll_result_snapshots"
+    poll_id = Column(Integer, ForeignKey("polls.id"), primary_key=True)
+    total_votes = Column(Integer, nullable=False, default=0)
+    payload = Column(Text, nullable=False)
+    etag = Column(String(32), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,55 @@
+from templating import templates
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import HTMLResponse
+from sqlalchemy.orm import Session, selectinload
+
+# Imports do sistema
+from database import get_db
+import crud, models
+import result_snapshots
+from auth_utils import verify_token
+
+# Trechos de HTML carregados sob demanda pelas páginas (carrosséis da home e modais do dashboard),
+# para que a primeira resposta não cresça com o número de enquetes
+router = APIRouter()
+
+@router.get("/polls", response_class=HTMLResponse)
+def poll_cards_page(request: Request, sort: str = "latest", cursor: int | None = None, db: Session = Depends(get_db)):
+    """
+    Próxima página de um carrossel da home (cursor = id do último card exibido).
+    """
+    if sort not in crud.CARD_SORTS:
+        raise HTTPException(400, "Ordenação inválida (use latest, popular ou oldest)")
+    cards, next_cursor = crud.get_poll_card_page(db, sort, cursor)
+    return templates.TemplateResponse("partials/poll_cards.html", {
+        "request": request,
+        "sort": sort,
+        "cards": cards,
+        "next_cursor": next_cursor
+    })
+
+@router.get("/dashboard/{poll_id}/results", response_class=HTMLResponse)
+def dashboard_results(poll_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Conteúdo do modal "Resultados Parciais" do dashboard (só para o dono da enquete).
+    """
+    token = request.cookies.get("access_token")
+    email = verify_token(token) if token else None
+    if not email: raise HTTPException(401, "Não autenticado")
+    user = crud.get_user_by_email(db, email)
+
+    poll = db.query(models.Poll).options(selectinload(models.Poll.options)).filter(models.Poll.id == poll_id).first()
+    if not poll or not user or poll.creator_id != user.id:
+        raise HTTPException(404, "Enquete não encontrada")
+
+    final = result_snapshots.get_final_results(db, poll)
+    if final:
+        results, total_votes = final["results"], final["total_votes"]
+    else:
+        results, total_votes = crud.build_results(poll.options, crud.get_option_counts(db, poll.id))
+    return templates.TemplateResponse("partials/dashboard_results.html", {
+        "request": request,
+        "poll": poll,
+        "results": results,
+        "total_votes": total_votes
+    })
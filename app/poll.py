@@ -1,6 +1,6 @@
-from database import templates
+from templating import templates
 from fastapi import APIRouter, Depends, HTTPException, Request, Form, Response, Cookie
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
@@ -10,6 +10,15 @@ from datetime import datetime
 from database import get_db
 import schemas, crud, models
 from auth_utils import verify_token
+from ip_keys import voter_key
+import archival
+import edge_cache
+import voted_cookie
+import vote_limit
+import vote_counters
+import result_snapshots
+import deadlines
+import share_cards
 
 MAX_VOTES_PER_IP = 3 
 
@@ -31,57 +40,68 @@ def get_optional_user(request: Request, db: Session):
     return None
 
 def get_client_ip(request: Request) -> str:
-    x_forwarded_for = request.headers.get("x-forwarded-for")
-    if x_forwarded_for:
-        return x_forwarded_for.split(",")[0].strip()
-    x_real_ip = request.headers.get("x-real-ip")
-    if x_real_ip:
-        return x_real_ip
+    # O uvicorn já troca pelo X-Forwarded-For quando a conexão vem de um proxy
+    # confiável (FORWARDED_ALLOW_IPS, ver gunicorn.conf.py); de outros o cabeçalho é ignorado,
+    # então é o mesmo IP que o limite de requisições usa
     return request.client.host
 
+def has_already_voted(request: Request, db: Session, poll, voted: str | None = None) -> bool:
+    """
+    Cookie de enquetes votadas (ou ?voted=true logo após votar) e,
+    nas enquetes com checagem de IP, o limite por IP.
+    """
+    if voted == "true" or poll.id in voted_cookie.load(request, db):
+        return True
+    if poll.check_ip:
+        voter_ip = voter_key(get_client_ip(request), poll.anonymous)
+        # Leitura pela chave primária de vote_ip_counters (ver vote_limit.py)
+        if vote_limit.get_count(db, poll.id, voter_ip) >= MAX_VOTES_PER_IP:
+            return True
+    return False
+
 @router.get("/{public_link}", response_class=HTMLResponse)
 def view_poll(public_link: str, request: Request, voted: str | None = None, db: Session = Depends(get_db)):
-    # 1. Pega usuário opcional (para o base.html)
-    user = get_optional_user(request, db)
+    # 1. Pega usuário opcional (para o base.html); no modo cache na borda a página não tem usuário
+    user = None if edge_cache.POLL_EDGE_CACHE else get_optional_user(request, db)
     
-    poll = crud.get_poll_by_link(db, public_link)
+    # Enquete + opções vêm do cache (sem consulta ao banco quando "quente")
+    poll = crud.get_poll_snapshot(db, public_link)
     
     if not poll:
         return templates.TemplateResponse("404.html", {"request": request, "user": user}, status_code=404)
 
     # 2. Lógica de Expiração
-    is_expired = False
-    if poll.archived:
-        is_expired = True
-    elif poll.deadline and datetime.now() > poll.deadline:
-        is_expired = True
+    is_expired = poll.archived or deadlines.is_expired(poll)
+
+    # Modo cache na borda: mesma página para todos (sem usuário nem "já votou");
+    # o navegador completa com /polls/{link}/state
+    if edge_cache.POLL_EDGE_CACHE:
+        return templates.TemplateResponse("poll.html", {
+            "request": request,
+            "poll": poll,
+            "user": None,
+            "options": poll.options,
+            "is_archived": poll.archived,
+            "is_expired": is_expired,
+            "already_voted": False,
+            "edge_cache": True
+        }, headers=edge_cache.cache_headers(poll))
 
     # 3. Lógica de Voto Já Realizado (Cookie + IP)
-    already_voted = False
-    cookie_name = f"voted_{poll.public_link}"
-    
-    if voted == "true" or request.cookies.get(cookie_name) == "true":
-        already_voted = True
-    elif poll.check_ip: 
-        voter_ip = get_client_ip(request)
-        ip_votes = db.query(models.Vote).filter(
-            models.Vote.poll_id == poll.id, 
-            models.Vote.voter_ip == voter_ip
-        ).count()
-        if ip_votes >= MAX_VOTES_PER_IP:
-            already_voted = True
-
-    options = db.query(models.Option).filter(models.Option.poll_id == poll.id).all()
-
-    return templates.TemplateResponse("poll.html", {
+    already_voted = has_already_voted(request, db, poll, voted)
+
+    response = templates.TemplateResponse("poll.html", {
         "request": request, 
         "poll": poll, 
         "user": user,  # Passando o usuário para o template
-        "options": options,
+        "options": poll.options,
         "is_archived": poll.archived,
-        "is_expired": (poll.deadline and datetime.now() > poll.deadline),
+        "is_expired": deadlines.is_expired(poll),
         "already_voted": already_voted
     })
+    # Converte cookies antigos (voted_{link}), se houver
+    voted_cookie.save(response, voted_cookie.load(request, db))
+    return response
 
 @router.post("/{public_link}/vote")
 def vote_poll(
@@ -92,27 +112,23 @@ def vote_poll(
     options: list[int] = Form(None) 
 ):
     user = get_optional_user(request, db) # Usuário para navbar
-    poll = crud.get_poll_by_link(db, public_link)
+    poll = crud.get_poll_snapshot(db, public_link)
     
     if not poll: raise HTTPException(404, "Enquete não encontrada")
     
-    # Validações de prazo
-    if poll.archived or (poll.deadline and datetime.now() > poll.deadline):
+    # Validações de prazo, com o estado atual do banco (não o do cache)
+    state = crud.get_poll_vote_state(db, poll.id)
+    if not state or state.archived or deadlines.is_expired(state):
         return RedirectResponse(f"/polls/{public_link}", status_code=303)
 
     # Validações de voto repetido
-    cookie_name = f"voted_{public_link}"
-    if request.cookies.get(cookie_name) == "true":
-        return RedirectResponse(f"/polls/{public_link}?voted=true", status_code=303)
+    voted = voted_cookie.load(request, db)
+    if poll.id in voted:
+        redirect = RedirectResponse(f"/polls/{public_link}?voted=true", status_code=303)
+        voted_cookie.save(redirect, voted)
+        return redirect
 
-    voter_ip = get_client_ip(request)
-    if poll.check_ip:
-        ip_votes = db.query(models.Vote).filter(
-            models.Vote.poll_id == poll.id, 
-            models.Vote.voter_ip == voter_ip
-        ).count()
-        if ip_votes >= MAX_VOTES_PER_IP:
-            return RedirectResponse(f"/polls/{public_link}?voted=true", status_code=303)
+    voter_ip = voter_key(get_client_ip(request), poll.anonymous)
 
     # Processamento das opções
     selected = []
@@ -122,57 +138,66 @@ def vote_poll(
         if option: selected = [option]
 
     if not selected:
-        options_db = db.query(models.Option).filter(models.Option.poll_id == poll.id).all()
         return templates.TemplateResponse("poll.html", {
             "request": request, 
             "poll": poll, 
             "user": user, # Passa user em caso de erro
-            "options": options_db,
+            "options": poll.options,
             "is_archived": poll.archived,
-            "is_expired": (poll.deadline and datetime.now() > poll.deadline),
+            "is_expired": deadlines.is_expired(poll),
             "already_voted": False,
             "error": "Selecione ao menos uma opção"
         })
 
-    poll_options = db.query(models.Option).filter(models.Option.poll_id == poll.id).all()
-    valid_ids = {o.id for o in poll_options}
+    valid_ids = {o.id for o in poll.options}
     for opt_id in selected:
         if opt_id not in valid_ids: raise HTTPException(400, "Opção inválida")
 
+    # Limite por IP aplicado no banco, na mesma transação dos votos:
+    # o contador só é incrementado se ainda estiver abaixo do limite
+    if poll.check_ip and not vote_limit.try_reserve(db, poll.id, voter_ip, len(selected), MAX_VOTES_PER_IP):
+        db.rollback()
+        return RedirectResponse(f"/polls/{public_link}?voted=true", status_code=303)
+
     for opt_id in selected:
         db.add(models.Vote(poll_id=poll.id, option_id=opt_id, voter_ip=voter_ip))
+    vote_counters.add_votes(db, poll, selected)
     db.commit()
 
     redirect = RedirectResponse(url=f"/polls/{public_link}?voted=true", status_code=303)
-    redirect.set_cookie(key=cookie_name, value="true", max_age=31536000, httponly=True, samesite="lax")
+    voted.add(poll.id)
+    voted_cookie.save(redirect, voted)
     return redirect
 
 @router.get("/{public_link}/results")
 def view_results(public_link: str, request: Request, db: Session = Depends(get_db)):
-    user = get_optional_user(request, db) # Usuário para navbar
-    poll = crud.get_poll_by_link(db, public_link)
+    poll = crud.get_poll_snapshot(db, public_link)
     
     if not poll:
+        user = get_optional_user(request, db)
         return templates.TemplateResponse("404.html", {"request": request, "user": user}, status_code=404)
 
-    options = db.query(models.Option).filter(models.Option.poll_id == poll.id).all()
-    votes = db.query(models.Vote).filter(models.Vote.poll_id == poll.id).all()
-    
-    total_votes = len(votes)
-    
-    results_data = []
-    for opt in options:
-        count = sum(1 for v in votes if v.option_id == opt.id)
-        if total_votes > 0:
-            percent = round((count / total_votes) * 100, 1)
-        else:
-            percent = 0
-            
-        results_data.append({
-            "text": opt.text, 
-            "votes": count,
-            "percent": percent 
-        })
+    # Enquete encerrada: resultado final congelado, página igual para todos
+    # (a navbar vem de /polls/{link}/state) e cache longo
+    final = result_snapshots.get_final_results(db, poll)
+    if final:
+        headers = result_snapshots.cache_headers(poll, final)
+        if result_snapshots.not_modified(request, final):
+            return Response(status_code=304, headers=headers)
+        return templates.TemplateResponse("results.html", {
+            "request": request,
+            "poll": poll,
+            "user": None,
+            "results": final["results"],
+            "total_votes": final["total_votes"],
+            "is_final": True
+        }, headers=headers)
+
+    user = get_optional_user(request, db) # Usuário para navbar
+
+    # Apuração agregada no banco (GROUP BY) e guardada em cache por alguns segundos
+    counts = crud.get_option_counts(db, poll.id)
+    results_data, total_votes = crud.build_results(poll.options, counts)
 
     return templates.TemplateResponse("results.html", {
         "request": request,
@@ -182,6 +207,47 @@ def view_results(public_link: str, request: Request, db: Session = Depends(get_d
         "total_votes": total_votes
     })
 
+@router.get("/{public_link}/state")
+def visitor_state(public_link: str, request: Request, voted: str | None = None, db: Session = Depends(get_db)):
+    """
+    Estado do visitante para a página em cache na borda: se já votou e,
+    para quem está logado, o menu da navbar já renderizado.
+    """
+    poll = crud.get_poll_snapshot(db, public_link)
+    if not poll: raise HTTPException(404, "Enquete não encontrada")
+    user = get_optional_user(request, db)
+    navbar = None
+    if user:
+        navbar = templates.get_template("partials/navbar.html").render(request=request, current_user=user)
+    response = JSONResponse(
+        {"already_voted": has_already_voted(request, db, poll, voted), "navbar": navbar},
+        headers={"Cache-Control": "private, no-store"}
+    )
+    voted_cookie.save(response, voted_cookie.load(request, db))
+    return response
+
+@router.get("/{public_link}/timeline")
+def vote_timeline(public_link: str, granularity: str = "hour", db: Session = Depends(get_db)):
+    """
+    Evolução dos votos (JSON para o gráfico da página de resultados).
+    """
+    if granularity not in crud.TIMELINE_WINDOWS:
+        raise HTTPException(400, "Granularidade inválida (use minute ou hour)")
+    poll = crud.get_poll_snapshot(db, public_link)
+    if not poll: raise HTTPException(404, "Enquete não encontrada")
+    return crud.get_vote_timeline(db, poll, granularity)
+
+@router.get("/{public_link}/og.jpg")
+def share_card(public_link: str, db: Session = Depends(get_db)):
+    """
+    Imagem de compartilhamento (og:image), guardada em disco; ver share_cards.py.
+    """
+    poll = crud.get_poll_snapshot(db, public_link)
+    if not poll: raise HTTPException(404, "Enquete não encontrada")
+    return Response(share_cards.get_card(db, poll), media_type="image/jpeg", headers={
+        "Cache-Control": f"public, max-age={share_cards.SHARE_CARD_MAX_AGE}"
+    })
+
 # --- ROTAS DE GERENCIAMENTO (Requer Login) ---
 
 @router.post("/{poll_id}/update_deadline")
@@ -229,6 +295,7 @@ def toggle_visibility_user(
 
     poll.is_public = not poll.is_public
     db.commit()
+    crud.invalidate_poll_cache(poll)
     return RedirectResponse("/dashboard", status_code=303)
 
 @router.post("/{poll_id}/toggle_archive")
@@ -249,6 +316,11 @@ def toggle_archive_user(
 
     poll.archived = not poll.archived
     db.commit()
+    crud.invalidate_poll_cache(poll)
+    if not poll.archived:
+        # Traz de volta os votos congelados pela tarefa de arquivamento
+        crud.discard_results_snapshot(db, poll.id)
+        archival.unfreeze_poll(db, poll.id)
     return RedirectResponse("/dashboard", status_code=303)
 
 @router.post("/{poll_id}/delete")
@@ -0,0 +1,23 @@
+"""
+Compila todos os templates para o cache de bytecode (roda no build da imagem).
+Assim os primeiros acessos de um container novo não pagam o parse do Jinja.
+
+Uso:  python precompile_templates.py
+"""
+import sys
+from templating import templates, TEMPLATE_CACHE_DIR
+
+def precompile() -> int:
+    env = templates.env
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+if __name__ == "__main__":
+    try:
+        count = precompile()
+    except Exception as e:
+        print(f"❌ Erro ao compilar templates: {e}")
+        sys.exit(1)
+    print(f"✅ {count} templates compilados em {TEMPLATE_CACHE_DIR}")
@@ -0,0 +1,145 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Modo de depuração: SQL_PROFILE=1 registra todas as consultas de cada requisição
+SQL_PROFILE = os.getenv("SQL_PROFILE", "0") == "1"
+# A partir de quantas repetições do mesmo formato de consulta consideramos N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_PROFILE_N_PLUS_ONE", 5))
+
+_IN_LIST = re.compile(r"\(\s*(?:%\(\w+\)s|\?|%s|:\w+)(?:\s*,\s*(?:%\(\w+\)s|\?|%s|:\w+))*\s*\)")
+_SPACES = re.compile(r"\s+")
+
+def statement_shape(statement: str) -> str:
+    """
+    Normaliza o SQL para agrupar consultas "iguais" (mesmo formato, parâmetros diferentes).
+    """
+    shape = _SPACES.sub(" ", statement).strip()
+    return _IN_LIST.sub("(...)", shape)
+
+class QueryRecorder:
+    def __init__(self):
+        self.statements = []
+
+    def add(self, statement: str, seconds: float):
+        self.statements.append((statement_shape(statement), seconds))
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(seconds for _, seconds in self.statements)
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD):
+        """
+        Formatos de consulta executados `threshold` vezes ou mais (suspeitos de N+1).
+        """
+        counts = Counter(shape for shape, _ in self.statements)
+        return [(shape, n) for shape, n in counts.most_common() if n >= threshold]
+
+    def summary(self) -> str:
+        lines = [f"{self.count} consultas em {self.total_seconds * 1000:.1f} ms"]
+        for shape, n in Counter(shape for shape, _ in self.statements).most_common(10):
+            lines.append(f"  {n}x {shape[:200]}")
+        return "\n".join(lines)
+
+# Consultas da requisição atual (middleware) e gravadores ativos (testes)
+_current: ContextVar[QueryRecorder | None] = ContextVar("sql_profile_recorder", default=None)
+_captures = []
+_captures_lock = threading.Lock()
+_installed_engines = set()
+
+def install(engine):
+    """
+    Liga os eventos do SQLAlchemy na engine (idempotente).
+    """
+    if id(engine) in _installed_engines:
+        return
+    _installed_engines.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["profile_start"].pop()
+        recorder = _current.get()
+        if recorder is not None:
+            recorder.add(statement, elapsed)
+        if _captures:
+            with _captures_lock:
+                for capture in _captures:
+                    capture.add(statement, elapsed)
+
+@contextmanager
+def capture(engine=None):
+    """
+    Grava todas as consultas feitas enquanto o bloco roda, em qualquer thread.
+    Útil com o TestClient, que executa a aplicação em outra thread.
+    """
+    if engine is None:
+        from database import engine
+    install(engine)
+    recorder = QueryRecorder()
+    with _captures_lock:
+        _captures.append(recorder)
+    try:
+        yield recorder
+    finally:
+        with _captures_lock:
+            _captures.remove(recorder)
+
+@contextmanager
+def query_budget(max_queries: int, engine=None):
+    """
+    Falha (AssertionError) se o bloco executar mais consultas que o orçamento.
+    Ex:  with query_budget(5): client.get("/")
+    """
+    with capture(engine) as recorder:
+        yield recorder
+    if recorder.count > max_queries:
+        raise AssertionError(f"Orçamento de {max_queries} consultas estourado.\n{recorder.summary()}")
+
+class SQLProfilerMiddleware:
+    """
+    Registra as consultas de cada requisição, devolve o resumo nos
+    cabeçalhos X-DB-Queries / X-DB-Time-Ms e avisa no log sobre N+1.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        recorder = QueryRecorder()
+        token = _current.set(recorder)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(recorder.count).encode()))
+                headers.append((b"x-db-time-ms", f"{recorder.total_seconds * 1000:.1f}".encode()))
+                repeated = recorder.repeated()
+                if repeated:
+                    headers.append((b"x-db-repeated-queries", str(len(repeated)).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            for shape, n in recorder.repeated():
+                logger.warning(f"🐢 Possível N+1 em {scope['method']} {scope['path']}: {n}x {shape[:300]}")
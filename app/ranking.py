@@ -0,0 +1,106 @@
+import os
+import logging
+from datetime import datetime, date, timedelta
+from sqlalchemy import func, case, update, bindparam
+from sqlalchemy.orm import Session
+
+import models, crud
+from cache import cache
+from tasks import periodic_job
+
+logger = logging.getLogger(__name__)
+
+# A cada meia-vida a pontuação de uma enquete cai pela metade
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", 24))
+TRENDING_INTERVAL = int(os.getenv("TRENDING_INTERVAL", 60))
+# Na carga inicial, votos mais velhos que isso (em meias-vidas) são ignorados
+BACKFILL_HALF_LIVES = 10
+# Abaixo disso a pontuação vira zero (evita atualizar enquetes esquecidas para sempre)
+MIN_SCORE = 0.01
+
+LAST_VOTE_KEY = "trending:last_vote_id"
+LAST_RUN_KEY = "trending:last_run"
+
+_poll_table = models.Poll.__table__
+
+def decay_factor(seconds: float) -> float:
+    return 0.5 ** (seconds / (TRENDING_HALF_LIFE_HOURS * 3600))
+
+def _backfill_increments(db: Session, max_vote_id: int, now: datetime) -> dict:
+    """
+    Primeira execução: soma os votos recentes já com o decaimento pela idade,
+    agrupando por dia para não trazer voto a voto do banco.
+    """
+    since = now - timedelta(hours=TRENDING_HALF_LIFE_HOURS * BACKFILL_HALF_LIVES)
+    day = func.date(models.Vote.voted_at)
+    rows = db.query(models.Vote.poll_id, day, func.count(models.Vote.id)).filter(
+        models.Vote.id <= max_vote_id,
+        models.Vote.voted_at >= since
+    ).group_by(models.Vote.poll_id, day).all()
+
+    increments = {}
+    for poll_id, voted_day, votes in rows:
+        if isinstance(voted_day, str):
+            voted_day = date.fromisoformat(voted_day)
+        # Meio do dia como idade aproximada (nunca no futuro)
+        middle = datetime.combine(voted_day, datetime.min.time()) + timedelta(hours=12)
+        age = max(0.0, (now - middle).total_seconds())
+        increments[poll_id] = increments.get(poll_id, 0.0) + votes * decay_factor(age)
+    return increments
+
+def _new_vote_increments(db: Session, last_vote_id: int, max_vote_id: int) -> dict:
+    """
+    Votos que chegaram desde a última execução valem 1 cada (são recentes).
+    """
+    rows = db.query(models.Vote.poll_id, func.count(models.Vote.id)).filter(
+        models.Vote.id > last_vote_id,
+        models.Vote.id <= max_vote_id
+    ).group_by(models.Vote.poll_id).all()
+    return {poll_id: float(votes) for poll_id, votes in rows}
+
+def _apply_decay(db: Session, factor: float):
+    decayed = models.Poll.popularity_score * factor
+    db.query(models.Poll).filter(models.Poll.popularity_score > 0).update(
+        {models.Poll.popularity_score: case((decayed < MIN_SCORE, 0), else_=decayed)},
+        synchronize_session=False
+    )
+
+def _apply_increments(db: Session, increments: dict):
+    if not increments:
+        return
+    statement = update(_poll_table).where(_poll_table.c.id == bindparam("poll_id")).values(
+        popularity_score=_poll_table.c.popularity_score + bindparam("increment")
+    )
+    db.execute(statement, [{"poll_id": poll_id, "increment": value} for poll_id, value in increments.items()])
+
+@periodic_job("ranking_popularidade", TRENDING_INTERVAL)
+def update_popularity_scores(db: Session):
+    """
+    Atualiza a pontuação de popularidade de forma incremental:
+    aplica o decaimento desde a última execução em todas as enquetes
+    e soma só os votos com id acima da marca d'água (até crud.get_settled_vote_id).
+    """
+    now = datetime.now()
+    last_vote_id = crud.get_job_state(db, LAST_VOTE_KEY)
+    # Só votos já assentados: um commit atrasado com id menor entra na próxima execução
+    max_vote_id = crud.get_settled_vote_id(db, int(last_vote_id or 0))
+
+    if last_vote_id is None:
+        db.query(models.Poll).update({models.Poll.popularity_score: 0}, synchronize_session=False)
+        increments = _backfill_increments(db, max_vote_id, now)
+        logger.info(f"📈 Ranking: pontuação inicial calculada para {len(increments)} enquetes.")
+    else:
+        last_run = crud.get_job_state(db, LAST_RUN_KEY)
+        if last_run:
+            elapsed = (now - datetime.fromisoformat(last_run)).total_seconds()
+            if elapsed > 0:
+                _apply_decay(db, decay_factor(elapsed))
+        increments = _new_vote_increments(db, int(last_vote_id), max_vote_id)
+
+    _apply_increments(db, increments)
+    crud.set_job_state(db, LAST_VOTE_KEY, max_vote_id)
+    crud.set_job_state(db, LAST_RUN_KEY, now.isoformat())
+    db.commit()
+
+    # O carrossel mostra a nova ordem na próxima visita
+    cache.invalidate_tag(crud.TRENDING_CACHE_TAG)
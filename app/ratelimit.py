@@ -0,0 +1,166 @@
+import os
+import re
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from starlette.responses import HTMLResponse
+
+from cache import cache, RedisCache
+from metrics import RATE_LIMIT_REJECTED
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# Quantidade máxima de chaves (IP + política) guardadas em memória
+MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", 100000))
+
+class RatePolicy:
+    """
+    Token bucket: `burst` requisições de uma vez, reabastecendo
+    `per_minute` fichas por minuto.
+    """
+    def __init__(self, name: str, method: str, path_pattern: str, per_minute: float, burst: int):
+        self.name = name
+        self.method = method
+        self.path_regex = re.compile(path_pattern)
+        self.rate = per_minute / 60.0
+        self.burst = burst
+
+# Rotas caras (bcrypt, SMTP, inserts de voto) e seus limites por IP
+POLICIES = [
+    RatePolicy("voto", "POST", r"^/polls/[^/]+/vote$", per_minute=20, burst=10),
+    RatePolicy("login", "POST", r"^/auth/token$", per_minute=10, burst=5),
+    RatePolicy("cadastro", "POST", r"^/auth/register$", per_minute=3, burst=3),
+    RatePolicy("esqueci_senha", "POST", r"^/auth/forgot-password$", per_minute=3, burst=3),
+]
+
+_POLICIES_BY_METHOD = {}
+for _policy in POLICIES:
+    _POLICIES_BY_METHOD.setdefault(_policy.method, []).append(_policy)
+
+def match_policy(method: str, path: str):
+    for policy in _POLICIES_BY_METHOD.get(method, ()):
+        if policy.path_regex.match(path):
+            return policy
+    return None
+
+# --- ARMAZENAMENTO DOS BALDES ---
+
+class MemoryBucketStore:
+    """
+    Baldes no próprio processo (LRU limitado a MAX_BUCKETS chaves).
+    """
+    blocking = False
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Consome uma ficha. Retorna 0 se permitido, ou os segundos até a próxima ficha.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry_after = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / rate
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+class RedisBucketStore:
+    """
+    Baldes compartilhados entre workers/réplicas. O script Lua
+    faz leitura, reabastecimento e consumo numa única operação atômica.
+    """
+    # Ida e volta de rede: o middleware chama numa thread, fora do event loop
+    blocking = True
+
+    SCRIPT = """
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 't'))
+    local last = tonumber(redis.call('HGET', KEYS[1], 'l'))
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    if tokens == nil then
+        tokens = burst
+        last = now
+    end
+    tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        retry_after = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 't', tostring(tokens), 'l', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(retry_after)
+    """
+
+    def __init__(self, client, prefix: str = "enquetes:rl:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        try:
+            return float(self._script(keys=[self.prefix + key], args=[rate, burst, time.time()]))
+        except Exception as e:
+            # Se o Redis cair, não derruba o site: libera a requisição
+            logger.warning(f"Rate limit via Redis indisponível: {e}")
+            return 0.0
+
+def build_store():
+    if isinstance(cache, RedisCache):
+        return RedisBucketStore(cache.client)
+    return MemoryBucketStore()
+
+class RateLimitMiddleware:
+    """
+    Middleware ASGI: só olha método e caminho para achar a política,
+    então rotas sem limite passam sem custo extra.
+    """
+    def __init__(self, app, store=None):
+        self.app = app
+        self.store = store or build_store()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+
+        policy = match_policy(scope["method"], scope["path"])
+        if policy is None:
+            return await self.app(scope, receive, send)
+
+        # Endereço da conexão, já corrigido pelo uvicorn só quando vem de um proxy confiável
+        # (FORWARDED_ALLOW_IPS em gunicorn.conf.py); o X-Forwarded-For do cliente não conta
+        client_ip = scope["client"][0] if scope.get("client") else "desconhecido"
+        key = f"{policy.name}:{client_ip}"
+        if self.store.blocking:
+            retry_after = await asyncio.to_thread(self.store.take, key, policy.rate, policy.burst)
+        else:
+            retry_after = self.store.take(key, policy.rate, policy.burst)
+        if retry_after <= 0:
+            return await self.app(scope, receive, send)
+
+        RATE_LIMIT_REJECTED.labels(policy.name).inc()
+        seconds = max(1, math.ceil(retry_after))
+        logger.warning(f"🚦 Rate limit '{policy.name}' atingido por {client_ip} (aguardar {seconds}s).")
+        response = HTMLResponse(
+            f"<h3>Muitas tentativas.</h3><p>Aguarde {seconds} segundos e tente novamente.</p>",
+            status_code=429,
+            headers={"Retry-After": str(seconds)},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session, selectinload
+
+import models, crud
+import edge_cache
+import deadlines
+import vote_counters
+from tasks import periodic_job
+
+logger = logging.getLogger(__name__)
+
+# Enquetes encerradas não mudam mais: o resultado é calculado uma vez e servido
+# daí em diante da tabela poll_result_snapshots, com cache longo no navegador/proxy.
+SNAPSHOT_INTERVAL = int(os.getenv("RESULTS_SNAPSHOT_INTERVAL", 60))
+# Espera após o prazo antes de congelar (votos em andamento e snapshots de enquete em cache);
+# nunca menos que a validade do cache da enquete
+SNAPSHOT_GRACE_SECONDS = max(int(os.getenv("RESULTS_SNAPSHOT_GRACE_SECONDS", crud.POLL_CACHE_TTL)), crud.POLL_CACHE_TTL)
+# Validade da página de resultado final no navegador; nos proxies vale até o purge
+RESULTS_SNAPSHOT_MAX_AGE = int(os.getenv("RESULTS_SNAPSHOT_MAX_AGE", 86400))
+RESULTS_SNAPSHOT_PROXY_MAX_AGE = 31536000
+SNAPSHOTS_PER_RUN = 100
+
+def is_closed(poll, now: datetime | None = None) -> bool:
+    return bool(poll.archived) or deadlines.is_expired(poll, now)
+
+def is_final(poll, now: datetime | None = None) -> bool:
+    """
+    Encerrada há tempo suficiente para nenhum voto atrasado ainda chegar.
+    Arquivada vale na hora: o voto lê archived na linha da enquete com trava
+    compartilhada (crud.get_poll_vote_state), então o UPDATE do arquivamento
+    espera os votos em andamento e os seguintes já são recusados.
+    """
+    now = now or datetime.now()
+    return bool(poll.archived) or bool(poll.deadline and poll.deadline <= now - timedelta(seconds=SNAPSHOT_GRACE_SECONDS))
+
+def get_final_results(db: Session, poll):
+    """
+    Resultado final da enquete, ou None se ela ainda estiver aberta
+    (ou encerrada mas ainda não congelada pela tarefa).
+    """
+    if not is_closed(poll):
+        return None
+    return crud.get_results_snapshot(db, poll.id)
+
+def cache_headers(poll, snapshot: dict) -> dict:
+    return {
+        "Cache-Control": f"public, max-age={RESULTS_SNAPSHOT_MAX_AGE}, s-maxage={RESULTS_SNAPSHOT_PROXY_MAX_AGE}",
+        "ETag": f'"{snapshot["etag"]}"',
+        "Surrogate-Key": edge_cache.surrogate_key(poll),
+    }
+
+def not_modified(request, snapshot: dict) -> bool:
+    tags = {tag.strip().removeprefix("W/").strip('"') for tag in request.headers.get("if-none-match", "").split(",")}
+    return snapshot["etag"] in tags
+
+def finalize_poll(db: Session, poll_id: int) -> bool:
+    """
+    Grava o resultado final. A linha da enquete fica travada, então uma
+    reabertura simultânea (novo prazo) espera e apaga o snapshot em seguida.
+    """
+    poll = db.query(models.Poll).options(selectinload(models.Poll.options)).filter(
+        models.Poll.id == poll_id
+    ).with_for_update().first()
+    if not poll or not is_final(poll) or db.get(models.PollResultSnapshot, poll_id):
+        db.rollback()
+        return False
+
+    results, total_votes = crud.build_results(poll.options, vote_counters.get_option_counts(db, poll_id))
+    payload = json.dumps({
+        "total_votes": total_votes,
+        "results": results,
+        "finalized_at": datetime.now().isoformat(timespec="seconds"),
+    }, ensure_ascii=False, separators=(",", ":"))
+    db.add(models.PollResultSnapshot(
+        poll_id=poll_id, total_votes=total_votes, payload=payload,
+        etag=hashlib.sha256(payload.encode()).hexdigest()[:32]
+    ))
+    db.commit()
+    crud.invalidate_poll_cache(poll)
+    return True
+
+@deadlines.close_hook(delay=SNAPSHOT_GRACE_SECONDS)
+def snapshot_closed_poll(db: Session, poll):
+    finalize_poll(db, poll.id)
+
+# Rede de segurança: arquivadas e encerramentos cujo gancho se perdeu (reinício do líder)
+@periodic_job("resultados_finais", SNAPSHOT_INTERVAL)
+def finalize_closed_polls(db: Session):
+    threshold = datetime.now() - timedelta(seconds=SNAPSHOT_GRACE_SECONDS)
+    finalized_ids = db.query(models.PollResultSnapshot.poll_id)
+    poll_ids = [poll_id for (poll_id,) in db.query(models.Poll.id).filter(
+        (models.Poll.archived == True) | (models.Poll.deadline <= threshold),
+        models.Poll.id.not_in(finalized_ids)
+    ).limit(SNAPSHOTS_PER_RUN).all()]
+
+    finalized = 0
+    for poll_id in poll_ids:
+        try:
+            if finalize_poll(db, poll_id):
+                finalized += 1
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Erro ao gravar o resultado final da enquete {poll_id}: {e}")
+    if finalized:
+        logger.info(f"🏁 Resultados finais: {finalized} enquetes encerradas congeladas.")
@@ -0,0 +1,106 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+
+import models, crud
+from tasks import periodic_job
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL = int(os.getenv("ROLLUP_INTERVAL", 60))
+# Votos lidos por lote (cada lote é uma transação: agregados + marca d'água juntos)
+ROLLUP_BATCH = int(os.getenv("ROLLUP_BATCH", 20000))
+# Lotes por execução, para a primeira carga não segurar o worker por muito tempo
+ROLLUP_MAX_BATCHES = 50
+# Os agregados por minuto só servem para a janela recente
+MINUTE_RETENTION_DAYS = int(os.getenv("ROLLUP_MINUTE_RETENTION_DAYS", 7))
+
+GRANULARITIES = ("minute", "hour")
+LAST_VOTE_KEY = "rollup:last_vote_id"
+
+_rollup_table = models.VoteRollup.__table__
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    moment = moment.replace(tzinfo=None, second=0, microsecond=0)
+    if granularity == "hour":
+        moment = moment.replace(minute=0)
+    return moment
+
+def _upsert_statement(dialect_name: str):
+    """
+    INSERT que soma na contagem existente quando o intervalo já existe.
+    """
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(_rollup_table)
+        return statement.on_duplicate_key_update(count=_rollup_table.c.count + statement.inserted.count)
+
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(_rollup_table)
+    return statement.on_conflict_do_update(
+        index_elements=[column.name for column in _rollup_table.primary_key],
+        set_={"count": _rollup_table.c.count + statement.excluded.count},
+    )
+
+def aggregate(votes) -> dict:
+    """
+    (poll_id, option_id, voted_at) -> {(poll, granularidade, início, opção): votos}
+    """
+    buckets = {}
+    for poll_id, option_id, voted_at in votes:
+        for granularity in GRANULARITIES:
+            key = (poll_id, granularity, bucket_start(voted_at, granularity), option_id)
+            buckets[key] = buckets.get(key, 0) + 1
+    return buckets
+
+def _process_batch(db: Session, last_vote_id: int, settled_vote_id: int) -> tuple[int, int]:
+    """
+    Retorna a nova marca d'água e quantos votos foram agregados.
+    """
+    votes = db.query(models.Vote.id, models.Vote.poll_id, models.Vote.option_id, models.Vote.voted_at).filter(
+        models.Vote.id > last_vote_id,
+        models.Vote.id <= settled_vote_id
+    ).order_by(models.Vote.id).limit(ROLLUP_BATCH).all()
+    if not votes:
+        return last_vote_id, 0
+
+    buckets = aggregate((poll_id, option_id, voted_at) for _, poll_id, option_id, voted_at in votes if voted_at)
+    if buckets:
+        db.execute(_upsert_statement(db.bind.dialect.name), [
+            {"poll_id": poll_id, "granularity": granularity, "bucket_start": start, "option_id": option_id, "count": count}
+            for (poll_id, granularity, start, option_id), count in buckets.items()
+        ])
+    new_last = votes[-1][0]
+    crud.set_job_state(db, LAST_VOTE_KEY, new_last)
+    db.commit()
+    return new_last, len(votes)
+
+def prune_minute_rollups(db: Session):
+    limit = datetime.now() - timedelta(days=MINUTE_RETENTION_DAYS)
+    removed = db.query(models.VoteRollup).filter(
+        models.VoteRollup.granularity == "minute",
+        models.VoteRollup.bucket_start < limit
+    ).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+@periodic_job("rollup_votos", ROLLUP_INTERVAL)
+def update_vote_rollups(db: Session):
+    """
+    Agrega os votos novos (id acima da marca d'água) nos intervalos
+    de minuto e hora, em lotes. Votos ainda não assentados (ver
+    crud.get_settled_vote_id) ficam para a próxima execução.
+    """
+    last_vote_id = int(crud.get_job_state(db, LAST_VOTE_KEY) or 0)
+    settled_vote_id = crud.get_settled_vote_id(db, last_vote_id)
+    for _ in range(ROLLUP_MAX_BATCHES):
+        last_vote_id, count = _process_batch(db, last_vote_id, settled_vote_id)
+        if count < ROLLUP_BATCH:
+            break
+    else:
+        logger.info(f"📊 Rollup de votos em andamento (até o voto {last_vote_id}), continua na próxima execução.")
+    prune_minute_rollups(db)
@@ -40,4 +40,62 @@ class PollOut(BaseModel):
     deadline: Optional[datetime]
     image_path: Optional[str]
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+# --- SNAPSHOTS (CÓPIAS IMUTÁVEIS GUARDADAS EM CACHE) ---
+
+class CreatorSnapshot(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    avatar_path: Optional[str]
+    created_at: Optional[datetime]
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+class OptionSnapshot(BaseModel):
+    id: int
+    text: str
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+class PollSnapshot(BaseModel):
+    """
+    Enquete + opções desacopladas da Session, para servir as páginas
+    públicas sem consultar o banco a cada acesso.
+    """
+    id: int
+    title: str
+    description: Optional[str]
+    multiple_choice: bool
+    check_ip: bool
+    is_public: bool
+    anonymous: Optional[bool]
+    archived: Optional[bool]
+    creator_id: Optional[int]
+    public_link: str
+    created_at: Optional[datetime]
+    deadline: Optional[datetime]
+    closed: Optional[bool] = False
+    image_path: Optional[str]
+    counter_shards: Optional[int] = None
+    creator: Optional[CreatorSnapshot]
+    options: list[OptionSnapshot]
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+class PollCard(BaseModel):
+    """
+    Dados mínimos para desenhar o card de uma enquete na página inicial.
+    """
+    id: int
+    title: str
+    description: Optional[str]
+    anonymous: Optional[bool]
+    public_link: str
+    created_at: Optional[datetime]
+    deadline: Optional[datetime]
+    image_path: Optional[str]
+    creator: Optional[CreatorSnapshot]
+    vote_count: int = 0
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
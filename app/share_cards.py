@@ -0,0 +1,239 @@
+import io
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+from sqlalchemy.orm import Session
+
+import crud
+import edge_cache
+import result_snapshots
+from storage import storage, UPLOAD_URL_PREFIX, TEMP_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+# Imagem de compartilhamento (og:image) de cada enquete: título, capa e opções mais votadas.
+# Os links compartilhados no WhatsApp recebem uma rajada de robôs logo em seguida, então
+# o card fica em disco e só é redesenhado quando o total de votos muda de faixa.
+SHARE_CARD_DIR = os.getenv("SHARE_CARD_DIR", "data/share_cards")
+# Faixa de votos: o card mostra o total arredondado da última vez que foi desenhado
+SHARE_CARD_VOTE_STEP = int(os.getenv("SHARE_CARD_VOTE_STEP", 25))
+# Mudou de faixa mas o card atual é mais novo que isso (segundos): continua valendo
+SHARE_CARD_MIN_INTERVAL = int(os.getenv("SHARE_CARD_MIN_INTERVAL", 300))
+# Validade no navegador/robôs
+SHARE_CARD_MAX_AGE = int(os.getenv("SHARE_CARD_MAX_AGE", 300))
+# Fontes TrueType (pacote fonts-dejavu-core no Dockerfile); sem elas usa a fonte embutida do Pillow
+SHARE_CARD_FONT_DIR = os.getenv("SHARE_CARD_FONT_DIR", "/usr/share/fonts/truetype/dejavu")
+
+# Mesmo tamanho declarado em og:image:width/height (base.html)
+CARD_SIZE = (1200, 630)
+COVER_WIDTH = 420
+PADDING = 60
+TOP_OPTIONS = 3
+STALE_GRACE_SECONDS = 60
+
+BACKGROUND = "#212529"
+BAR_BACKGROUND = "#343a40"
+BAR_COLOR = "#0d6efd"
+TEXT_COLOR = "#ffffff"
+MUTED_COLOR = "#adb5bd"
+
+# Um desenho por vez neste worker: a rajada de robôs espera o primeiro e reaproveita o arquivo
+_render_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def _font(size: int, bold: bool = False):
+    name = "DejaVuSans-Bold.ttf" if bold else "DejaVuSans.ttf"
+    try:
+        return ImageFont.truetype(os.path.join(SHARE_CARD_FONT_DIR, name), size)
+    except OSError:
+        logger.warning(f"⚠️ Fonte {name} não encontrada em {SHARE_CARD_FONT_DIR}; usando a embutida do Pillow.")
+        return ImageFont.load_default(size)
+
+def _fit(draw: ImageDraw.ImageDraw, text: str, font, width: int) -> str:
+    """
+    Corta o texto com reticências até caber na largura.
+    """
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text.rstrip() + "…"
+
+def _wrap(draw: ImageDraw.ImageDraw, text: str, font, width: int, max_lines: int) -> list[str]:
+    lines, current = [], ""
+    words = text.split()
+    for index, word in enumerate(words):
+        candidate = f"{current} {word}".strip()
+        if draw.textlength(candidate, font=font) <= width or not current:
+            current = candidate
+            continue
+        lines.append(_fit(draw, current, font, width))
+        current = word
+        if len(lines) == max_lines:
+            # Última linha cheia: o resto vira reticências
+            lines[-1] = _fit(draw, " ".join([lines[-1]] + words[index:]), font, width)
+            return lines
+    if current:
+        lines.append(_fit(draw, current, font, width))
+    return lines
+
+def _load_cover(image_path: str | None):
+    """
+    Capa da enquete (chave do storage ou caminho antigo /static/uploads/...), ou None.
+    """
+    if not image_path or image_path.startswith(("http://", "https://")):
+        return None
+    key = image_path.lstrip("/").removeprefix(UPLOAD_URL_PREFIX.lstrip("/"))
+    try:
+        img = Image.open(io.BytesIO(storage.read(key)))
+        img.draft("RGB", (COVER_WIDTH, CARD_SIZE[1]))
+        return img.convert("RGB")
+    except Exception as e:
+        logger.warning(f"⚠️ Card de compartilhamento sem capa ({image_path}): {e}")
+        return None
+
+def render_card(poll, results: list[dict], total_votes: int, closed: bool) -> bytes:
+    """
+    Desenha o card (JPEG 1200x630): título, até 3 opções mais votadas com barras e o total.
+    """
+    card = Image.new("RGB", CARD_SIZE, BACKGROUND)
+    draw = ImageDraw.Draw(card)
+    text_width = CARD_SIZE[0] - 2 * PADDING
+
+    cover = _load_cover(poll.image_path)
+    if cover:
+        card.paste(ImageOps.fit(cover, (COVER_WIDTH, CARD_SIZE[1]), Image.Resampling.LANCZOS), (CARD_SIZE[0] - COVER_WIDTH, 0))
+        text_width -= COVER_WIDTH
+
+    y = PADDING
+    draw.text((PADDING, y), "RESULTADO FINAL" if closed else "ENQUETE", font=_font(26, bold=True), fill=MUTED_COLOR)
+    y += 50
+
+    title_font = _font(52, bold=True)
+    for line in _wrap(draw, poll.title, title_font, text_width, max_lines=3):
+        draw.text((PADDING, y), line, font=title_font, fill=TEXT_COLOR)
+        y += 64
+    y += 20
+
+    option_font = _font(28)
+    footer_y = CARD_SIZE[1] - PADDING - 30
+    top = sorted(results, key=lambda r: r["votes"], reverse=True)[:TOP_OPTIONS]
+    for result in top:
+        # Título longo: mostra só as opções que cabem acima do rodapé
+        if y + 78 > footer_y - 10:
+            break
+        percent = f"{result['percent']:g}%"
+        percent_width = draw.textlength(percent, font=option_font)
+        draw.text((PADDING, y), _fit(draw, result["text"], option_font, text_width - percent_width - 20), font=option_font, fill=TEXT_COLOR)
+        draw.text((PADDING + text_width - percent_width, y), percent, font=option_font, fill=MUTED_COLOR)
+        y += 42
+        draw.rounded_rectangle((PADDING, y, PADDING + text_width, y + 12), radius=6, fill=BAR_BACKGROUND)
+        if result["percent"]:
+            filled = max(12, int(text_width * result["percent"] / 100))
+            draw.rounded_rectangle((PADDING, y, PADDING + filled, y + 12), radius=6, fill=BAR_COLOR)
+        y += 36
+
+    votes = f"{total_votes} voto" if total_votes == 1 else f"{total_votes} votos"
+    footer = votes if closed else f"{votes} · Vote agora!"
+    draw.text((PADDING, footer_y), footer, font=_font(28, bold=True), fill=MUTED_COLOR)
+
+    output = io.BytesIO()
+    card.save(output, format="JPEG", quality=85, optimize=True)
+    return output.getvalue()
+
+def _poll_dir(poll_id: int) -> str:
+    return os.path.join(SHARE_CARD_DIR, str(poll_id))
+
+def _fingerprint(poll, closed: bool) -> str:
+    # Editar título/capa/opções ou encerrar muda o nome: réplicas com outro disco não servem o card antigo
+    parts = [poll.title, poll.image_path or "", "1" if closed else "0"] + [option.text for option in poll.options]
+    return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()[:12]
+
+def _recent_card(directory: str, fingerprint: str) -> str | None:
+    """
+    Card da mesma versão da enquete desenhado há menos de SHARE_CARD_MIN_INTERVAL.
+    """
+    newest, newest_mtime = None, time.time() - SHARE_CARD_MIN_INTERVAL
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return None
+    for entry in entries:
+        if entry.name.startswith(fingerprint + "-") and entry.name.endswith(".jpg"):
+            mtime = entry.stat().st_mtime
+            if mtime > newest_mtime:
+                newest, newest_mtime = entry.path, mtime
+    return newest
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{uuid.uuid4().hex}{TEMP_SUFFIX}"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    # Os anteriores (outras faixas de votos ou versões) saem, menos os de agora há pouco
+    # (quem já os abriu termina de ler mesmo depois de apagados)
+    stale = time.time() - STALE_GRACE_SECONDS
+    for entry in os.scandir(os.path.dirname(path)):
+        if entry.path == path:
+            continue
+        try:
+            if entry.stat().st_mtime < stale:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+def _read(path: str) -> bytes | None:
+    # Outra requisição pode apagar o arquivo (_write, discard_cards) a qualquer momento
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def get_card(db: Session, poll) -> bytes:
+    """
+    JPEG do card da enquete, desenhando só se não houver um válido em disco.
+    Devolve o conteúdo já lido: o arquivo pode sumir enquanto a resposta é enviada.
+    """
+    closed = result_snapshots.is_closed(poll)
+    directory = _poll_dir(poll.id)
+    fingerprint = _fingerprint(poll, closed)
+    # Rajada de robôs: um card recente desta versão vale sem contar os votos
+    recent = _recent_card(directory, fingerprint)
+    data = _read(recent) if recent else None
+    if data is not None:
+        return data
+
+    final = result_snapshots.get_final_results(db, poll)
+    if final:
+        results, total_votes = final["results"], final["total_votes"]
+    else:
+        results, total_votes = crud.build_results(poll.options, crud.get_option_counts(db, poll.id))
+
+    path = os.path.join(directory, f"{fingerprint}-{total_votes // SHARE_CARD_VOTE_STEP}.jpg")
+    data = _read(path)
+    if data is not None:
+        return data
+
+    with _render_lock:
+        data = _read(path)
+        if data is None:
+            data = render_card(poll, results, total_votes, closed)
+            try:
+                _write(path, data)
+            except OSError as e:
+                # Diretório apagado no meio (discard_cards): o card desenhado ainda serve
+                logger.warning(f"⚠️ Card de compartilhamento não gravado ({path}): {e}")
+    return data
+
+@edge_cache.purge_hook
+def discard_cards(poll):
+    # Enquete alterada ou excluída: o próximo acesso desenha de novo
+    shutil.rmtree(_poll_dir(poll.id), ignore_errors=True)
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+import logging
+from contextlib import contextmanager
+from sqlalchemy.sql import text
+
+from database import engine, SessionLocal
+from auth_utils import get_password_hash
+import models
+import migrations
+
+logger = logging.getLogger(__name__)
+
+# Configuração de espera pelo banco
+DB_MAX_RETRIES = int(os.getenv("DB_MAX_RETRIES", 30))
+DB_RETRY_INTERVAL = int(os.getenv("DB_RETRY_INTERVAL", 2))
+
+# Nome do lock usado para que só um processo faça o bootstrap do schema
+BOOTSTRAP_LOCK_NAME = "enquetes_bootstrap"
+BOOTSTRAP_LOCK_TIMEOUT = 120
+
+# Variável herdada pelos workers do gunicorn quando o master já fez o bootstrap
+BOOTSTRAPPED_ENV = "ENQUETES_BOOTSTRAPPED"
+
+def _ping_database():
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+def wait_for_database_sync(max_retries: int = DB_MAX_RETRIES, retry_interval: int = DB_RETRY_INTERVAL) -> bool:
+    """
+    Versão bloqueante, usada no processo master do gunicorn (antes de existir event loop).
+    """
+    logger.info("⏳ Iniciando verificação de conexão com o Banco de Dados...")
+    for i in range(max_retries):
+        try:
+            _ping_database()
+            logger.info("✅ Banco de Dados conectado com sucesso!")
+            return True
+        except Exception:
+            logger.warning(f"⚠️ Banco indisponível. Tentativa {i+1}/{max_retries}...")
+            time.sleep(retry_interval)
+    logger.error("❌ Falha crítica: Não foi possível conectar ao banco.")
+    return False
+
+async def wait_for_database(max_retries: int = DB_MAX_RETRIES, retry_interval: int = DB_RETRY_INTERVAL) -> bool:
+    """
+    Aguarda o banco sem travar o event loop: a tentativa roda numa thread
+    e a espera entre tentativas é um asyncio.sleep.
+    """
+    logger.info("⏳ Iniciando verificação de conexão com o Banco de Dados...")
+    for i in range(max_retries):
+        try:
+            await asyncio.to_thread(_ping_database)
+            logger.info("✅ Banco de Dados conectado com sucesso!")
+            return True
+        except Exception:
+            logger.warning(f"⚠️ Banco indisponível. Tentativa {i+1}/{max_retries}...")
+            await asyncio.sleep(retry_interval)
+    logger.error("❌ Falha crítica: Não foi possível conectar ao banco.")
+    return False
+
+@contextmanager
+def named_lock(name: str, timeout: int):
+    """
+    Lock distribuído via GET_LOCK do MySQL (vale entre workers e entre réplicas).
+    Em outros bancos (ex: SQLite nos benchmarks) vira um no-op.
+    """
+    if engine.dialect.name != "mysql":
+        yield True
+        return
+
+    with engine.connect() as connection:
+        acquired = connection.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"), {"name": name, "timeout": timeout}
+        ).scalar() == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
+
+def create_default_admin():
+    db = SessionLocal()
+    try:
+        any_user = db.query(models.User).first()
+
+        if not any_user:
+            logger.info("--- TABELA VAZIA DETECTADA: CRIANDO ADMIN PADRÃO ---")
+            hashed = get_password_hash("admin")
+            admin_user = models.User(
+                first_name="Super",
+                last_name="Admin",
+                email="admin@admin",
+                hashed_password=hashed,
+                is_verified=True,
+                is_admin=True,
+                is_blocked=False
+            )
+            db.add(admin_user)
+            db.commit()
+            logger.info("--- ADMIN CRIADO: admin@admin / admin ---")
+    except Exception as e:
+        logger.error(f"Erro ao criar admin padrão: {e}")
+    finally:
+        db.close()
+
+def bootstrap_database():
+    """
+    Cria as tabelas, aplica as migrações leves e cria o admin padrão. Protegido por lock para que,
+    com vários workers/réplicas subindo juntos, só um execute de cada vez.
+    Erro nas tabelas ou migrações interrompe a inicialização: subir com o esquema
+    pela metade (ex: voter_ip ainda em texto) gravaria dados no formato errado.
+    """
+    with named_lock(BOOTSTRAP_LOCK_NAME, BOOTSTRAP_LOCK_TIMEOUT) as acquired:
+        if not acquired:
+            logger.warning("⚠️ Não foi possível obter o lock de bootstrap, seguindo mesmo assim.")
+        try:
+            models.Base.metadata.create_all(bind=engine)
+            migrations.run_migrations(engine)
+        except Exception as e:
+            logger.error(f"❌ Erro durante a inicialização das tabelas, abortando: {e}")
+            raise
+        # Sem admin padrão o sistema ainda funciona: o erro só é registrado
+        create_default_admin()
+
+def already_bootstrapped() -> bool:
+    return os.environ.get(BOOTSTRAPPED_ENV) == "1"
+
+def mark_bootstrapped():
+    os.environ[BOOTSTRAPPED_ENV] = "1"
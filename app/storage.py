@@ -0,0 +1,203 @@
+import os
+import re
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Onde ficam os uploads: "filesystem" (pasta static/uploads, padrão) ou "s3"
+# (qualquer serviço compatível: AWS S3, MinIO, R2...). O banco guarda só a chave
+# (ex: ab/abcd...jpg); a URL é montada na renderização pelo filtro media_url.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "filesystem")
+# Base pública dos arquivos (CDN, bucket público ou nginx servindo a pasta). Vazio = padrão do backend
+STORAGE_PUBLIC_URL = os.getenv("STORAGE_PUBLIC_URL", "").rstrip("/")
+
+UPLOAD_DIR = "static/uploads"
+UPLOAD_URL_PREFIX = "/static/uploads/"
+TEMP_SUFFIX = ".tmp"
+
+S3_BUCKET = os.getenv("S3_BUCKET", "enquetes")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # ex: http://minio:9000
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_PREFIX = os.getenv("S3_PREFIX", "uploads/")
+# Validade das URLs assinadas entregues por /media/<chave> quando o bucket é privado
+S3_PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", 3600))
+
+# Os arquivos nunca mudam depois de gravados (nome = hash do conteúdo)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Chaves aceitas em /media: as endereçadas por hash e os nomes antigos da raiz
+_KEY_RE = re.compile(r"^(?:[0-9a-f]{2}/)?[\w.-]+$")
+
+def valid_key(key: str) -> bool:
+    return bool(_KEY_RE.match(key)) and not key.startswith(".")
+
+class FileSystemStorage:
+    """
+    Arquivos numa pasta local, servidos em /static/uploads (ou por STORAGE_PUBLIC_URL).
+    """
+    def __init__(self, root: str = UPLOAD_DIR, public_url: str = STORAGE_PUBLIC_URL):
+        self.root = root
+        self.base_url = f"{public_url}/" if public_url else UPLOAD_URL_PREFIX
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def save(self, key: str, data: bytes, content_type: str):
+        """
+        Grava se ainda não existir; se existir, só renova a data (carência da limpeza).
+        """
+        path = self._path(key)
+        if os.path.exists(path):
+            os.utime(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}{TEMP_SUFFIX}"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def read(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def modified_at(self, key: str) -> float | None:
+        try:
+            return os.stat(self._path(key)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def list(self, after: str = "", limit: int = 1000) -> list[tuple[str, float]]:
+        """
+        (chave, data de modificação) em ordem, a partir da chave seguinte a `after`.
+        """
+        items = []
+        for key in self._iter_keys(after):
+            modified = self.modified_at(key)
+            if modified is not None:
+                items.append((key, modified))
+            if len(items) >= limit:
+                break
+        return items
+
+    def _iter_keys(self, after: str):
+        after_top, _, after_inner = after.partition("/")
+        for entry in sorted(os.scandir(self.root), key=lambda e: e.name):
+            if entry.name < after_top:
+                continue
+            if entry.is_dir():
+                for inner in sorted(os.listdir(entry.path)):
+                    if entry.name == after_top and inner <= after_inner:
+                        continue
+                    yield f"{entry.name}/{inner}"
+            elif entry.name != after_top or after_inner:
+                yield entry.name
+
+    def url(self, key: str) -> str:
+        return self.base_url + key
+
+    def redirect_url(self, key: str) -> str:
+        return self.url(key)
+
+class S3Storage:
+    """
+    Bucket S3 (ou compatível, ex: MinIO com S3_ENDPOINT_URL). Os bytes nunca
+    passam pela aplicação na leitura: a página aponta para STORAGE_PUBLIC_URL
+    ou para /media/<chave>, que redireciona para uma URL assinada.
+    """
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX, public_url: str = STORAGE_PUBLIC_URL, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("Pacote 'boto3' não instalado. Adicione-o ao requirements.txt para usar STORAGE_BACKEND=s3")
+            # Credenciais pela cadeia padrão do boto3 (AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY, perfil, IAM)
+            client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_url = public_url
+
+    def _object_key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _head(self, key: str):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self.client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def save(self, key: str, data: bytes, content_type: str):
+        object_key = self._object_key(key)
+        if self._head(key) is not None:
+            # Copiar sobre si mesmo renova o LastModified (carência da limpeza)
+            self.client.copy_object(
+                Bucket=self.bucket, Key=object_key,
+                CopySource={"Bucket": self.bucket, "Key": object_key},
+                MetadataDirective="REPLACE", ContentType=content_type, CacheControl=IMMUTABLE_CACHE_CONTROL,
+            )
+            return
+        self.client.put_object(
+            Bucket=self.bucket, Key=object_key, Body=data,
+            ContentType=content_type, CacheControl=IMMUTABLE_CACHE_CONTROL,
+        )
+
+    def read(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"].read()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def modified_at(self, key: str) -> float | None:
+        head = self._head(key)
+        return head["LastModified"].timestamp() if head else None
+
+    def list(self, after: str = "", limit: int = 1000) -> list[tuple[str, float]]:
+        params = {"Bucket": self.bucket, "Prefix": self.prefix, "MaxKeys": limit}
+        if after:
+            params["StartAfter"] = self._object_key(after)
+        response = self.client.list_objects_v2(**params)
+        return [
+            (item["Key"][len(self.prefix):], item["LastModified"].timestamp())
+            for item in response.get("Contents", [])
+        ]
+
+    def url(self, key: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{key}"
+        return f"/media/{key}"
+
+    def redirect_url(self, key: str) -> str:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._object_key(key)}, ExpiresIn=S3_PRESIGN_EXPIRES
+        )
+
+def build_storage():
+    if STORAGE_BACKEND == "s3":
+        logger.info(f"🪣 Uploads no bucket S3 '{S3_BUCKET}'{f' ({S3_ENDPOINT_URL})' if S3_ENDPOINT_URL else ''}.")
+        return S3Storage()
+    return FileSystemStorage()
+
+storage = build_storage()
+
+def media_url(value: str | None) -> str:
+    """
+    Filtro Jinja: chave guardada no banco -> URL da imagem. Caminhos antigos
+    (/static/uploads/...) e URLs completas passam como estão.
+    """
+    if not value:
+        return ""
+    if value.startswith(("/", "http://", "https://")):
+        return value
+    if value.startswith("static/"):
+        return "/" + value
+    return storage.url(value)
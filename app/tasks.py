@@ -0,0 +1,166 @@
+import asyncio
+import os
+import logging
+from sqlalchemy.sql import text
+
+from database import engine, SessionLocal
+from metrics import track_background
+
+logger = logging.getLogger(__name__)
+
+# Lock que elege o worker "líder", o único que roda as tarefas periódicas
+LEADER_LOCK_NAME = "enquetes_background_jobs"
+LEADER_CHECK_INTERVAL = int(os.getenv("LEADER_CHECK_INTERVAL", 30))
+
+# Registro das tarefas periódicas: nome -> (função, intervalo em segundos)
+PERIODIC_JOBS = {}
+
+def periodic_job(name: str, interval: int):
+    """
+    Decorator para registrar uma tarefa periódica.
+    A função recebe uma Session e roda numa thread, fora do event loop.
+    """
+    def decorator(func):
+        PERIODIC_JOBS[name] = (func, interval)
+        return func
+    return decorator
+
+# Serviços contínuos do líder (corrotinas): nome -> função async sem argumentos
+LEADER_SERVICES = {}
+
+def leader_service(name: str):
+    """
+    Decorator para registrar uma corrotina que roda enquanto o worker for
+    líder (ex: o agendador de prazos). É cancelada se a liderança for perdida.
+    """
+    def decorator(func):
+        LEADER_SERVICES[name] = func
+        return func
+    return decorator
+
+def _run_job(func):
+    db = SessionLocal()
+    try:
+        return func(db)
+    finally:
+        db.close()
+
+async def _job_loop(name: str, func, interval: int):
+    while True:
+        try:
+            await asyncio.to_thread(_run_job, track_background(f"job:{name}", func))
+        except Exception as e:
+            logger.error(f"Erro na tarefa periódica '{name}': {e}")
+        await asyncio.sleep(interval)
+
+async def _service_loop(name: str, func):
+    while True:
+        try:
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro no serviço '{name}': {e}")
+        # Se a corrotina terminar ou falhar, recomeça depois de uma pausa
+        await asyncio.sleep(LEADER_CHECK_INTERVAL)
+
+class LeaderLock:
+    """
+    Mantém uma conexão dedicada segurando GET_LOCK no MySQL.
+    Se o worker morrer, a conexão cai e o lock é liberado para outro worker assumir.
+    Em outros bancos assume que existe um único processo (sempre líder).
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.connection = None
+
+    def try_acquire(self) -> bool:
+        if engine.dialect.name != "mysql":
+            return True
+        connection = engine.connect()
+        try:
+            acquired = connection.execute(
+                text("SELECT GET_LOCK(:name, 0)"), {"name": self.name}
+            ).scalar() == 1
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self.connection = connection
+        return True
+
+    def is_held(self) -> bool:
+        if engine.dialect.name != "mysql":
+            return True
+        if self.connection is None:
+            return False
+        try:
+            # A consulta também mantém a conexão viva (evita o wait_timeout do MySQL)
+            return self.connection.execute(
+                text("SELECT IS_USED_LOCK(:name) = CONNECTION_ID()"), {"name": self.name}
+            ).scalar() == 1
+        except Exception:
+            self.release()
+            return False
+
+    def release(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": self.name})
+        except Exception:
+            pass
+        finally:
+            try: self.connection.invalidate()
+            except Exception: pass
+            self.connection = None
+
+class BackgroundJobs:
+    def __init__(self):
+        self.lock = LeaderLock(LEADER_LOCK_NAME)
+        self.job_tasks = []
+        self.leader_task = None
+        self.is_leader = False
+
+    def _start_jobs(self):
+        self.is_leader = True
+        for name, (func, interval) in PERIODIC_JOBS.items():
+            self.job_tasks.append(asyncio.create_task(_job_loop(name, func, interval)))
+        for name, func in LEADER_SERVICES.items():
+            self.job_tasks.append(asyncio.create_task(_service_loop(name, func)))
+
+    async def _stop_jobs(self):
+        for task in self.job_tasks:
+            task.cancel()
+        await asyncio.gather(*self.job_tasks, return_exceptions=True)
+        self.job_tasks = []
+        self.is_leader = False
+
+    async def _leader_loop(self):
+        while True:
+            try:
+                if not self.is_leader:
+                    if await asyncio.to_thread(self.lock.try_acquire):
+                        logger.info(f"👑 Worker {os.getpid()} assumiu as tarefas em segundo plano.")
+                        self._start_jobs()
+                elif not await asyncio.to_thread(self.lock.is_held):
+                    logger.warning(f"⚠️ Worker {os.getpid()} perdeu a liderança das tarefas.")
+                    await self._stop_jobs()
+            except Exception as e:
+                logger.error(f"Erro na eleição de líder: {e}")
+            await asyncio.sleep(LEADER_CHECK_INTERVAL)
+
+    def start(self):
+        self.leader_task = asyncio.create_task(self._leader_loop())
+
+    async def stop(self):
+        if self.leader_task:
+            self.leader_task.cancel()
+            await asyncio.gather(self.leader_task, return_exceptions=True)
+            self.leader_task = None
+        await self._stop_jobs()
+        await asyncio.to_thread(self.lock.release)
+
+background_jobs = BackgroundJobs()
@@ -0,0 +1,68 @@
+import os
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from fastapi.templating import Jinja2Templates
+
+from cache import LRUCache
+from storage import media_url
+
+TEMPLATES_DIR = "templates"
+
+# Templates já compilados para bytecode (gerados no build da imagem, ver precompile_templates.py).
+# Fica fora de data/, que é um volume e esconderia o que foi gerado no build.
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", ".jinja_cache")
+
+# Em produção os templates não mudam: sem checar o arquivo a cada renderização
+TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "1") == "1"
+
+# Cache de fragmentos ({% cache %}): quantidade máxima de trechos guardados e validade
+FRAGMENT_CACHE_MAX_ITEMS = int(os.getenv("FRAGMENT_CACHE_MAX_ITEMS", 2000))
+FRAGMENT_CACHE_TTL = int(os.getenv("FRAGMENT_CACHE_TTL", 600))
+
+fragment_cache = LRUCache(max_size=FRAGMENT_CACHE_MAX_ITEMS, ttl=FRAGMENT_CACHE_TTL)
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache "nome", chave1, chave2 %} ... {% endcache %}
+    Guarda o HTML do trecho pela chave; as chaves devem incluir tudo que
+    o trecho exibe (ex: id e total de votos), pois mudar a chave é a invalidação.
+    """
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render_cached", [nodes.List(key)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        key = tuple(key)
+        try:
+            html = fragment_cache.get(key)
+        except TypeError:
+            # Chave com valor não "hasheável": renderiza sem cache
+            return caller()
+        if html is None:
+            html = caller()
+            fragment_cache.set(key, html)
+        return html
+
+def build_templates() -> Jinja2Templates:
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    templates = Jinja2Templates(
+        directory=TEMPLATES_DIR,
+        bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+        auto_reload=TEMPLATES_AUTO_RELOAD,
+        extensions=[FragmentCacheExtension],
+    )
+    templates.env.globals["app_version"] = os.environ.get("APP_VERSION", "dev-local")
+    # Chave de upload guardada no banco -> URL (ver storage.py)
+    templates.env.filters["media_url"] = media_url
+    return templates
+
+# Ambiente único compartilhado por todas as rotas (um só cache de templates)
+templates = build_templates()
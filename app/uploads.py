@@ -0,0 +1,201 @@
+import io
+import os
+import time
+import hashlib
+import logging
+import warnings
+from fastapi import HTTPException, UploadFile
+from starlette.responses import HTMLResponse
+from PIL import Image
+from sqlalchemy.orm import Session
+
+import models, crud
+from storage import storage, UPLOAD_DIR, UPLOAD_URL_PREFIX, TEMP_SUFFIX
+from tasks import periodic_job
+
+logger = logging.getLogger(__name__)
+
+# Tamanho máximo de cada arquivo enviado e da requisição inteira (arquivo + campos do formulário)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", MAX_UPLOAD_BYTES + 1024 * 1024))
+# Limite de pixels (largura x altura) checado no cabeçalho, antes de decodificar a imagem
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 40_000_000))
+ALLOWED_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+
+# Vale para qualquer Image.open do processo: acima do limite o Pillow acusa "decompression bomb"
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Limpeza incremental: a cada execução confere UPLOAD_GC_BATCH arquivos (do backend em storage.py) a partir de onde parou
+# e apaga os que nenhuma enquete (image_path) ou usuário (avatar_path) usa mais
+UPLOAD_GC_INTERVAL = int(os.getenv("UPLOAD_GC_INTERVAL", 600))
+UPLOAD_GC_BATCH = int(os.getenv("UPLOAD_GC_BATCH", 500))
+# Arquivos mais novos que isso ficam (o upload pode ainda não ter sido salvo no banco)
+UPLOAD_GC_GRACE_SECONDS = int(os.getenv("UPLOAD_GC_GRACE_SECONDS", 3600))
+GC_CURSOR_KEY = "upload_gc_cursor"
+
+COVER_SIZE = (686, 386)
+COVER_MAX_KB = 95
+AVATAR_MAX_SIZE = (512, 512)
+
+class UploadError(ValueError):
+    """
+    Arquivo recusado; a mensagem pode ser mostrada ao usuário.
+    """
+
+def checked_file(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    Arquivo do upload (o Starlette já o guardou num SpooledTemporaryFile),
+    rebobinado, depois de conferir o tamanho sem copiar o conteúdo.
+    """
+    size = upload.size
+    if size is None:
+        # Sem Content-Length na parte do formulário: mede pelo fim do arquivo
+        upload.file.seek(0, os.SEEK_END)
+        size = upload.file.tell()
+    if size > max_bytes:
+        raise UploadError(f"Arquivo muito grande (máximo {max_bytes // (1024 * 1024)} MB).")
+    if not size:
+        raise UploadError("Arquivo vazio.")
+    upload.file.seek(0)
+    return upload.file
+
+def open_image(fileobj, target_size: tuple[int, int]) -> Image.Image:
+    """
+    Abre a imagem lendo só o cabeçalho, recusa formato ou dimensões fora do
+    limite e só então decodifica (JPEG já reduzido para perto de target_size).
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            img = Image.open(fileobj)
+            if img.format not in ALLOWED_FORMATS:
+                raise UploadError("Formato de imagem não suportado (use JPG, PNG, GIF ou WEBP).")
+            width, height = img.size
+            if width * height > MAX_IMAGE_PIXELS:
+                raise UploadError(f"Imagem muito grande ({width}x{height} pixels).")
+            img.draft("RGB", target_size)
+            img.load()
+    except UploadError:
+        raise
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise UploadError("Imagem muito grande.")
+    except Exception as e:
+        logger.warning(f"⚠️ Upload recusado: imagem inválida ({e})")
+        raise UploadError("O arquivo deve ser uma imagem válida.")
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img
+
+def _save(data: bytes) -> str:
+    """
+    Grava pelo hash do conteúdo (ab/abcd....jpg) e devolve a chave guardada
+    no banco: a mesma imagem enviada de novo reaproveita o arquivo que já existe.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    key = f"{digest[:2]}/{digest}.jpg"
+    storage.save(key, data, "image/jpeg")
+    return key
+
+def save_poll_cover(upload: UploadFile) -> str:
+    """
+    Capa da enquete: 686x386 em JPEG, comprimida até ~95 KB (bom para o WhatsApp).
+    """
+    img = open_image(checked_file(upload), COVER_SIZE)
+
+    # Redimensiona para resolução FIXA (pode esticar imagens com outra proporção)
+    img = img.resize(COVER_SIZE, Image.Resampling.LANCZOS)
+
+    # Reduz a qualidade até caber no tamanho desejado
+    quality = 90
+    output = io.BytesIO()
+    while True:
+        output.seek(0)
+        output.truncate()
+        img.save(output, format="JPEG", quality=quality, optimize=True)
+        if output.tell() / 1024 <= COVER_MAX_KB or quality <= 20:
+            break
+        quality -= 10
+    return _save(output.getvalue())
+
+def save_avatar(upload: UploadFile) -> str:
+    """
+    Foto de perfil: reduzida para no máximo 512x512 e regravada em JPEG.
+    """
+    img = open_image(checked_file(upload), AVATAR_MAX_SIZE)
+    img.thumbnail(AVATAR_MAX_SIZE, Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=85, optimize=True)
+    return _save(output.getvalue())
+
+class BodySizeLimitMiddleware:
+    """
+    Middleware ASGI: recusa com 413 requisições maiores que MAX_REQUEST_BYTES,
+    pelo Content-Length ou contando os bytes recebidos (envio chunked),
+    antes que o formulário inteiro seja gravado em disco.
+    """
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = HTMLResponse(
+                f"<h3>Arquivo muito grande.</h3><p>O limite é de {self.max_bytes // (1024 * 1024)} MB.</p>",
+                status_code=413,
+            )
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Cai no tratamento de erros do FastAPI durante a leitura do formulário
+                    raise HTTPException(413, "Requisição muito grande.")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+# --- LIMPEZA DE ARQUIVOS SEM REFERÊNCIA ---
+
+def _referenced(db: Session, keys: list[str]) -> set[str]:
+    # Valores antigos guardam o caminho (/static/uploads/... ou sem a barra inicial)
+    values = {}
+    for key in keys:
+        for value in (key, UPLOAD_URL_PREFIX + key, UPLOAD_URL_PREFIX.lstrip("/") + key):
+            values[value] = key
+    used = db.query(models.Poll.image_path).filter(models.Poll.image_path.in_(values)).all()
+    used += db.query(models.User.avatar_path).filter(models.User.avatar_path.in_(values)).all()
+    return {values[value] for (value,) in used}
+
+@periodic_job("limpeza_uploads", UPLOAD_GC_INTERVAL)
+def collect_garbage(db: Session):
+    cursor = crud.get_job_state(db, GC_CURSOR_KEY) or ""
+    batch = storage.list(after=cursor, limit=UPLOAD_GC_BATCH)
+
+    old_enough = time.time() - UPLOAD_GC_GRACE_SECONDS
+    candidates = [key for key, modified in batch if modified < old_enough]
+    in_use = _referenced(db, [key for key in candidates if not key.endswith(TEMP_SUFFIX)]) if candidates else set()
+    removed = 0
+    for key in candidates:
+        if key in in_use:
+            continue
+        # Confere de novo: um upload igual pode ter reaproveitado o arquivo agora há pouco
+        modified = storage.modified_at(key)
+        if modified is not None and modified < old_enough:
+            storage.delete(key)
+            removed += 1
+
+    # Fim da listagem: a próxima execução recomeça do início
+    crud.set_job_state(db, GC_CURSOR_KEY, batch[-1][0] if len(batch) >= UPLOAD_GC_BATCH else "")
+    db.commit()
+    if removed:
+        logger.info(f"🧹 Uploads: {removed} arquivos sem referência removidos.")
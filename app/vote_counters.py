@@ -0,0 +1,147 @@
+import os
+import random
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, delete, insert
+from sqlalchemy.orm import Session
+
+import models
+from tasks import periodic_job
+
+logger = logging.getLogger(__name__)
+
+# Linhas de contador por opção. Cada voto soma 1 numa linha sorteada, então
+# votos simultâneos na mesma opção raramente esperam pelo mesmo lock.
+# Pode ser trocado por enquete (Poll.counter_shards, no painel admin).
+VOTE_COUNTER_SHARDS = int(os.getenv("VOTE_COUNTER_SHARDS", 4))
+MAX_COUNTER_SHARDS = 64
+
+COMPACT_INTERVAL = int(os.getenv("COUNTER_COMPACT_INTERVAL", 300))
+# Só junta os shards de enquetes sem votos há esse tempo (nas ativas eles voltariam a se espalhar)
+COMPACT_IDLE_MINUTES = int(os.getenv("COUNTER_COMPACT_IDLE_MINUTES", 30))
+COMPACT_POLLS_PER_RUN = 200
+
+_shard_table = models.OptionVoteShard.__table__
+
+def shard_count(poll) -> int:
+    return max(1, min(poll.counter_shards or VOTE_COUNTER_SHARDS, MAX_COUNTER_SHARDS))
+
+def _upsert_statement(dialect_name: str):
+    """
+    INSERT que soma na linha do shard quando ela já existe.
+    """
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        statement = dialect_insert(_shard_table)
+        return statement.on_duplicate_key_update(
+            count=_shard_table.c.count + statement.inserted.count,
+            updated_at=statement.inserted.updated_at,
+        )
+
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    statement = dialect_insert(_shard_table)
+    return statement.on_conflict_do_update(
+        index_elements=[column.name for column in _shard_table.primary_key],
+        set_={"count": _shard_table.c.count + statement.excluded.count, "updated_at": statement.excluded.updated_at},
+    )
+
+def add_votes(db: Session, poll, option_ids: list[int]):
+    """
+    Soma os votos nos contadores, na transação de quem chamou (junto com os INSERTs em votes).
+    """
+    shards = shard_count(poll)
+    now = datetime.now()
+    db.execute(_upsert_statement(db.bind.dialect.name), [
+        {"poll_id": poll.id, "option_id": option_id, "shard": random.randrange(shards), "count": 1, "updated_at": now}
+        for option_id in option_ids
+    ])
+
+def get_option_counts(db: Session, poll_id: int) -> dict:
+    rows = db.query(models.OptionVoteShard.option_id, func.sum(models.OptionVoteShard.count)).filter(
+        models.OptionVoteShard.poll_id == poll_id
+    ).group_by(models.OptionVoteShard.option_id).all()
+    return {option_id: int(votes) for option_id, votes in rows}
+
+def get_vote_totals(db: Session, poll_ids: list[int]) -> dict:
+    if not poll_ids:
+        return {}
+    rows = db.query(models.OptionVoteShard.poll_id, func.sum(models.OptionVoteShard.count)).filter(
+        models.OptionVoteShard.poll_id.in_(poll_ids)
+    ).group_by(models.OptionVoteShard.poll_id).all()
+    return {poll_id: int(votes) for poll_id, votes in rows}
+
+def rebuild(connection, poll_id: int | None = None) -> int:
+    """
+    Recalcula os contadores (no shard 0) a partir dos votos: apurações
+    congeladas + votos vivos. Usada no backfill da migração.
+    """
+    vote, poll, tally = models.Vote.__table__, models.Poll.__table__, models.PollTally.__table__
+    live = select(vote.c.poll_id, vote.c.option_id, func.count(vote.c.id).label("votes")).join(
+        poll, poll.c.id == vote.c.poll_id
+    ).where(vote.c.id > func.coalesce(poll.c.frozen_up_to_vote_id, 0)).group_by(vote.c.poll_id, vote.c.option_id)
+    frozen = select(tally.c.poll_id, tally.c.option_id, tally.c.count.label("votes"))
+    clear = delete(_shard_table)
+    if poll_id is not None:
+        live = live.where(vote.c.poll_id == poll_id)
+        frozen = frozen.where(tally.c.poll_id == poll_id)
+        clear = clear.where(_shard_table.c.poll_id == poll_id)
+
+    counts = {}
+    for source in (live, frozen):
+        for row_poll_id, option_id, votes in connection.execute(source):
+            counts[(row_poll_id, option_id)] = counts.get((row_poll_id, option_id), 0) + int(votes)
+
+    connection.execute(clear)
+    if counts:
+        connection.execute(insert(_shard_table), [
+            {"poll_id": row_poll_id, "option_id": option_id, "shard": 0, "count": votes}
+            for (row_poll_id, option_id), votes in counts.items()
+        ])
+    return len(counts)
+
+def compact_poll(db: Session, poll_id: int):
+    """
+    Junta os shards de cada opção numa linha só (shard 0). As linhas ficam
+    travadas durante a troca, então um voto que chegue agora só espera o commit.
+    """
+    rows = db.execute(
+        select(_shard_table.c.option_id, _shard_table.c.count, _shard_table.c.updated_at).where(
+            _shard_table.c.poll_id == poll_id
+        ).with_for_update()
+    ).all()
+    totals, updated = {}, {}
+    for option_id, votes, updated_at in rows:
+        totals[option_id] = totals.get(option_id, 0) + votes
+        if updated_at and (option_id not in updated or updated_at > updated[option_id]):
+            updated[option_id] = updated_at
+    db.execute(delete(_shard_table).where(_shard_table.c.poll_id == poll_id))
+    if totals:
+        db.execute(insert(_shard_table), [
+            {"poll_id": poll_id, "option_id": option_id, "shard": 0, "count": votes, "updated_at": updated.get(option_id)}
+            for option_id, votes in totals.items()
+        ])
+    db.commit()
+
+@periodic_job("compactacao_contadores", COMPACT_INTERVAL)
+def compact_counters(db: Session):
+    """
+    Enquetes paradas não precisam de shards: junta as linhas para a leitura somar menos.
+    """
+    idle_since = datetime.now() - timedelta(minutes=COMPACT_IDLE_MINUTES)
+    shard = models.OptionVoteShard
+    poll_ids = [poll_id for (poll_id,) in db.query(shard.poll_id).group_by(shard.poll_id).having(
+        func.count() > func.count(func.distinct(shard.option_id)),
+        func.max(shard.updated_at) < idle_since
+    ).limit(COMPACT_POLLS_PER_RUN).all()]
+
+    for poll_id in poll_ids:
+        try:
+            compact_poll(db, poll_id)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Erro ao compactar os contadores da enquete {poll_id}: {e}")
+    if poll_ids:
+        logger.info(f"🧮 Contadores: shards compactados em {len(poll_ids)} enquetes.")
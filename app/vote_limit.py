@@ -0,0 +1,67 @@
+import logging
+from sqlalchemy import func, select, update, delete, insert
+
+import models
+
+logger = logging.getLogger(__name__)
+
+_counter_table = models.VoteIPCounter.__table__
+_vote_table = models.Vote.__table__
+
+def _insert_missing_statement(dialect_name: str):
+    """
+    INSERT da linha do contador (com zero) que não faz nada se ela já existir.
+    """
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        statement = dialect_insert(_counter_table)
+        return statement.on_duplicate_key_update(count=_counter_table.c.count)
+
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(_counter_table).on_conflict_do_nothing()
+
+def try_reserve(db, poll_id: int, voter_ip: bytes, votes: int, limit: int) -> bool:
+    """
+    Soma `votes` ao contador do IP se ele ainda estiver abaixo do limite.
+    O UPDATE condicional é atômico e a linha fica travada até o commit do voto,
+    então requisições simultâneas do mesmo IP esperam umas pelas outras
+    (e só elas). False = limite atingido; quem chamou deve desfazer a transação.
+    """
+    db.execute(_insert_missing_statement(db.bind.dialect.name).values(poll_id=poll_id, voter_ip=voter_ip, count=0))
+    result = db.execute(
+        update(_counter_table).where(
+            _counter_table.c.poll_id == poll_id,
+            _counter_table.c.voter_ip == voter_ip,
+            _counter_table.c.count < limit
+        ).values(count=_counter_table.c.count + votes)
+    )
+    return result.rowcount == 1
+
+def get_count(db, poll_id: int, voter_ip: bytes) -> int:
+    return db.execute(
+        select(_counter_table.c.count).where(
+            _counter_table.c.poll_id == poll_id,
+            _counter_table.c.voter_ip == voter_ip
+        )
+    ).scalar() or 0
+
+def rebuild(connection, poll_id: int | None = None) -> int:
+    """
+    Recalcula os contadores a partir da tabela votes (todas as enquetes ou uma só).
+    Usada no backfill da migração e quando votos voltam do arquivamento.
+    """
+    # Só as enquetes com checagem de IP usam contadores
+    checked_polls = select(models.Poll.id).where(models.Poll.check_ip == True)
+    counts = select(
+        _vote_table.c.poll_id, _vote_table.c.voter_ip, func.count(_vote_table.c.id)
+    ).where(_vote_table.c.poll_id.in_(checked_polls)).group_by(_vote_table.c.poll_id, _vote_table.c.voter_ip)
+    clear = delete(_counter_table)
+    if poll_id is not None:
+        counts = counts.where(_vote_table.c.poll_id == poll_id)
+        clear = clear.where(_counter_table.c.poll_id == poll_id)
+    connection.execute(clear)
+    result = connection.execute(insert(_counter_table).from_select(["poll_id", "voter_ip", "count"], counts))
+    return result.rowcount
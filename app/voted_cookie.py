@@ -0,0 +1,138 @@
+import os
+import hmac
+import base64
+import hashlib
+import binascii
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+import models
+from auth_utils import SECRET_KEY
+
+# Um único cookie com as enquetes em que o navegador já votou (substitui os antigos voted_{link}).
+# Conteúdo: ids em ordem de uso, como diferenças codificadas em varint (zigzag), assinado com HMAC.
+COOKIE_NAME = "voted_polls"
+COOKIE_MAX_AGE = 31536000
+# Tamanho máximo do valor do cookie; passando disso as enquetes votadas há mais tempo saem
+VOTED_COOKIE_MAX_BYTES = int(os.getenv("VOTED_COOKIE_MAX_BYTES", 2048))
+
+LEGACY_PREFIX = "voted_"
+FORMAT_VERSION = 1
+SIGNATURE_SIZE = 12
+
+_KEY = hashlib.sha256(SECRET_KEY.encode() + b":voted-polls").digest()
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(_KEY, payload, hashlib.sha256).digest()[:SIGNATURE_SIZE]
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def encode_ids(ids) -> bytes:
+    out = bytearray([FORMAT_VERSION])
+    previous = 0
+    for poll_id in ids:
+        delta = poll_id - previous
+        _write_varint(out, (delta << 1) ^ (delta >> 63))
+        previous = poll_id
+    return bytes(out)
+
+def decode_ids(payload: bytes) -> list[int]:
+    if not payload or payload[0] != FORMAT_VERSION:
+        raise ValueError("versão desconhecida")
+    ids, previous, value, shift = [], 0, 0, 0
+    for byte in payload[1:]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += (value >> 1) ^ -(value & 1)
+        ids.append(previous)
+        value, shift = 0, 0
+    if shift:
+        raise ValueError("varint incompleto")
+    return ids
+
+def dumps(ids) -> str:
+    payload = encode_ids(ids)
+    return base64.urlsafe_b64encode(payload + _sign(payload)).rstrip(b"=").decode()
+
+def loads(value: str) -> list[int]:
+    """
+    Lista de ids do cookie; cookie adulterado ou ilegível vira lista vazia.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+    except (binascii.Error, ValueError):
+        return []
+    payload, signature = raw[:-SIGNATURE_SIZE], raw[-SIGNATURE_SIZE:]
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return []
+    try:
+        return decode_ids(payload)
+    except ValueError:
+        return []
+
+class VotedPolls:
+    """
+    Conjunto ordenado (o mais recente no fim) das enquetes votadas neste navegador.
+    """
+    def __init__(self, ids=()):
+        self._ids = dict.fromkeys(ids)
+        self.legacy_cookies = []
+        self.changed = False
+
+    def __contains__(self, poll_id: int) -> bool:
+        return poll_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, poll_id: int):
+        self._ids.pop(poll_id, None)
+        self._ids[poll_id] = None
+        self.changed = True
+
+    def cookie_value(self) -> str:
+        ids = list(self._ids)
+        value = dumps(ids)
+        while len(value) > VOTED_COOKIE_MAX_BYTES and ids:
+            # Descarta as menos recentes até caber (o limite por IP continua valendo para elas)
+            ids = ids[max(1, len(ids) // 10):]
+            value = dumps(ids)
+        return value
+
+def load(request: Request, db: Session) -> VotedPolls:
+    """
+    Lê o cookie uma vez por requisição. Cookies antigos voted_{link} são
+    convertidos para ids (uma consulta) e apagados quando a resposta for salva.
+    """
+    voted = getattr(request.state, "voted_polls", None)
+    if voted is not None:
+        return voted
+
+    voted = VotedPolls(loads(request.cookies.get(COOKIE_NAME, "")))
+    legacy = {
+        name[len(LEGACY_PREFIX):]: name for name in request.cookies
+        if name.startswith(LEGACY_PREFIX) and name != COOKIE_NAME
+    }
+    if legacy:
+        rows = db.query(models.Poll.id).filter(models.Poll.public_link.in_(legacy)).order_by(models.Poll.id).all()
+        for (poll_id,) in rows:
+            if poll_id not in voted:
+                voted.add(poll_id)
+        voted.legacy_cookies = list(legacy.values())
+        voted.changed = True
+
+    request.state.voted_polls = voted
+    return voted
+
+def save(response: Response, voted: VotedPolls):
+    if not voted.changed:
+        return
+    response.set_cookie(key=COOKIE_NAME, value=voted.cookie_value(), max_age=COOKIE_MAX_AGE, httponly=True, samesite="lax")
+    for name in voted.legacy_cookies:
+        response.delete_cookie(name)
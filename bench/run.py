@@ -0,0 +1,257 @@
+"""
+Gerador de carga: dispara requisições concorrentes nas rotas principais
+e mede p50/p95/p99 e requisições por segundo de cada uma.
+
+Uso (na própria aplicação, sem servidor):
+    DATABASE_URL=sqlite:////tmp/enquetes-bench.db python bench/run.py --label antes
+
+Contra um servidor rodando (o DATABASE_URL deve apontar para o mesmo banco):
+    DATABASE_URL=mysql+mysqlconnector://... python bench/run.py --url http://localhost:8000 --label prod
+Aí todas as requisições saem do IP desta máquina, e nas enquetes com checagem de IP
+os votos param no limite por IP.
+
+Comparando com uma execução anterior:
+    python bench/run.py --label depois --compare bench/results/antes.json
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+
+import httpx
+
+from seed import load_app, random_ip, BENCH_PASSWORD, BENCH_USER_EMAIL, BENCH_ADMIN_EMAIL
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Peso de cada rota na carga (proporção aproximada do tráfego real)
+DEFAULT_MIX = {
+    "view_poll": 40,
+    "vote_poll": 15,
+    "view_results": 20,
+    "home": 15,
+    "dashboard": 5,
+    "admin": 5,
+}
+
+def load_targets():
+    """
+    Busca no banco as enquetes abertas (link, opções, múltipla escolha) para sortear nas requisições.
+    """
+    database, models = load_app()
+    db = database.SessionLocal()
+    try:
+        now = datetime.now()
+        polls = db.query(models.Poll).filter(models.Poll.archived == False).all()
+        targets = []
+        for poll in polls:
+            if poll.deadline and poll.deadline.replace(tzinfo=None) < now:
+                continue
+            option_ids = [option.id for option in poll.options]
+            if option_ids:
+                targets.append((poll.public_link, option_ids, poll.multiple_choice))
+        return targets
+    finally:
+        db.close()
+
+async def login(client: httpx.AsyncClient, email: str) -> str:
+    response = await client.post("/auth/token", data={"username": email, "password": BENCH_PASSWORD})
+    token = response.cookies.get("access_token")
+    if not token:
+        raise SystemExit(f"Falha no login de {email} (status {response.status_code}). Rode bench/seed.py antes.")
+    return token
+
+class Worker:
+    """
+    Cada worker faz uma requisição por vez, com seus próprios clientes
+    (anônimo, usuário e admin), então os cookies não se misturam.
+    """
+    def __init__(self, base_url, transport, user_token, admin_token, targets, rng):
+        if isinstance(transport, httpx.ASGITransport):
+            # Transporte próprio: cada requisição do worker sai de um IP sorteado
+            transport = httpx.ASGITransport(app=transport.app)
+        self.transport = transport
+
+        def client(cookies=None):
+            return httpx.AsyncClient(base_url=base_url, transport=transport, cookies=cookies, follow_redirects=False, timeout=60)
+        self.anon = client()
+        self.user = client({"access_token": user_token})
+        self.admin = client({"access_token": admin_token})
+        self.targets = targets
+        self.rng = rng
+
+    async def close(self):
+        for client in (self.anon, self.user, self.admin):
+            await client.aclose()
+
+    async def request(self, endpoint: str) -> httpx.Response:
+        link, option_ids, multiple = self.rng.choice(self.targets)
+        if self.transport is not None:
+            self.transport.client = (random_ip(self.rng), 123)
+        if endpoint == "view_poll":
+            response = await self.anon.get(f"/polls/{link}")
+        elif endpoint == "vote_poll":
+            if multiple:
+                data = {"options": self.rng.sample(option_ids, self.rng.randint(1, len(option_ids)))}
+            else:
+                data = {"option": self.rng.choice(option_ids)}
+            response = await self.anon.post(f"/polls/{link}/vote", data=data)
+        elif endpoint == "view_results":
+            response = await self.anon.get(f"/polls/{link}/results")
+        elif endpoint == "home":
+            response = await self.anon.get("/")
+        elif endpoint == "dashboard":
+            response = await self.user.get("/dashboard")
+        elif endpoint == "admin":
+            response = await self.admin.get("/admin/")
+        else:
+            raise ValueError(endpoint)
+        # Descarta o cookie "voted_..." para o próximo voto não ser bloqueado
+        self.anon.cookies.clear()
+        return response
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+    }
+
+async def run_load(base_url: str, transport, requests: int, concurrency: int, mix: dict, random_seed: int):
+    targets = load_targets()
+    if not targets:
+        raise SystemExit("Nenhuma enquete aberta no banco. Rode bench/seed.py antes.")
+
+    async with httpx.AsyncClient(base_url=base_url, transport=transport) as client:
+        user_token = await login(client, BENCH_USER_EMAIL)
+        admin_token = await login(client, BENCH_ADMIN_EMAIL)
+
+    rng = random.Random(random_seed)
+    endpoints = list(mix)
+    plan = rng.choices(endpoints, weights=[mix[name] for name in endpoints], k=requests)
+    latencies = {name: [] for name in endpoints}
+    errors = {name: 0 for name in endpoints}
+    queue = iter(plan)
+
+    async def worker_loop(worker_id: int):
+        worker = Worker(base_url, transport, user_token, admin_token, targets, random.Random(random_seed + worker_id))
+        try:
+            for endpoint in queue:
+                start = time.perf_counter()
+                try:
+                    response = await worker.request(endpoint)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                latencies[endpoint].append(time.perf_counter() - start)
+                if failed:
+                    errors[endpoint] += 1
+        finally:
+            await worker.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker_loop(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "endpoints": {name: summarize(latencies[name], errors[name], elapsed) for name in endpoints if latencies[name]},
+        "total": summarize(all_latencies, sum(errors.values()), elapsed),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+def print_report(result, baseline=None):
+    header = f"{'rota':<14}{'n':>7}{'erros':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'Δp50':>9}{'Δp95':>9}{'Δp99':>9}{'Δrps':>9}"
+    print(header)
+    rows = list(result["endpoints"].items()) + [("TOTAL", result["total"])]
+    for name, stats in rows:
+        line = f"{name:<14}{stats['count']:>7}{stats['errors']:>7}{stats['rps']:>9.1f}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        if baseline:
+            old = baseline["total"] if name == "TOTAL" else baseline["endpoints"].get(name)
+            if old:
+                for key in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+                    line += f"{delta(old[key], stats[key]):>9}"
+        print(line)
+
+def delta(old: float, new: float) -> str:
+    if not old:
+        return "-"
+    return f"{(new - old) / old * 100:+.0f}%"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga das rotas principais.")
+    parser.add_argument("--url", help="Servidor alvo (padrão: a aplicação em processo, via ASGI)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--label", default=datetime.now().strftime("%Y%m%d-%H%M%S"))
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--mix", help="Pesos das rotas, ex: view_poll=50,vote_poll=50")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if not os.getenv("DATABASE_URL"):
+        parser.error("Defina DATABASE_URL apontando para o banco gerado por bench/seed.py.")
+
+    mix = dict(DEFAULT_MIX)
+    if args.mix:
+        mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+        unknown = set(mix) - set(DEFAULT_MIX)
+        if unknown:
+            parser.error(f"Rotas desconhecidas em --mix: {', '.join(sorted(unknown))}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    if args.url:
+        base_url, transport = args.url, None
+    else:
+        load_app()
+        # Sem servidor: as requisições vão direto para o app ASGI
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+        import main as app_main
+        base_url, transport = "http://bench", httpx.ASGITransport(app=app_main.app)
+
+    result = asyncio.run(run_load(base_url, transport, args.requests, args.concurrency, mix, args.seed))
+    result = {
+        "label": args.label,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "url": args.url or "asgi",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": mix,
+            "database": os.getenv("DATABASE_URL").split("://")[0],
+        },
+        **result,
+    }
+
+    print_report(result, baseline)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{args.label}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"\nResultado salvo em {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Popula um banco (MySQL ou SQLite) com dados sintéticos para os benchmarks.
+
+Uso:
+    DATABASE_URL=sqlite:////tmp/enquetes-bench.db python bench/seed.py --polls 500 --votes 200000
+"""
+import os
+import sys
+import random
+import argparse
+import ipaddress
+import uuid
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+# Senha de todos os usuários gerados (o hash é calculado uma vez só)
+BENCH_PASSWORD = "bench123"
+BENCH_USER_EMAIL = "bench-user-0@example.com"
+BENCH_ADMIN_EMAIL = "bench-admin@example.com"
+
+def load_app():
+    """
+    Importa os módulos da aplicação (que usam imports relativos à pasta app/).
+    """
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+    import database, models
+    return database, models
+
+def random_ip(rng: random.Random) -> str:
+    if rng.random() < 0.8:
+        return str(ipaddress.IPv4Address(rng.getrandbits(32)))
+    return str(ipaddress.IPv6Address(rng.getrandbits(128)))
+
+def seed(users: int = 50, polls: int = 200, options: int = 4, votes: int = 20000, random_seed: int = 42, batch: int = 5000):
+    database, models = load_app()
+    from sqlalchemy import insert
+    from auth_utils import get_password_hash
+    from ip_keys import voter_key
+
+    rng = random.Random(random_seed)
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+
+    hashed = get_password_hash(BENCH_PASSWORD)
+    now = datetime.now()
+
+    with database.engine.begin() as conn:
+        user_rows = [{
+            "first_name": f"Usuário {i}", "last_name": "Bench",
+            "email": f"bench-user-{i}@example.com", "hashed_password": hashed,
+            "is_verified": True, "is_admin": False, "is_blocked": False,
+        } for i in range(users)]
+        user_rows.append({
+            "first_name": "Admin", "last_name": "Bench", "email": BENCH_ADMIN_EMAIL,
+            "hashed_password": hashed, "is_verified": True, "is_admin": True, "is_blocked": False,
+        })
+        conn.execute(insert(models.User), user_rows)
+        user_ids = [row[0] for row in conn.execute(models.User.__table__.select().with_only_columns(models.User.id))]
+
+        poll_rows = []
+        for i in range(polls):
+            created = now - timedelta(days=rng.uniform(0, 90))
+            deadline = None
+            if rng.random() < 0.3:
+                deadline = created + timedelta(days=rng.uniform(1, 60))
+            poll_rows.append({
+                "title": f"Enquete de benchmark {i}",
+                "description": "Texto explicativo " * rng.randint(0, 20) or None,
+                "multiple_choice": rng.random() < 0.3,
+                "check_ip": rng.random() < 0.5,
+                "is_public": rng.random() < 0.9,
+                "anonymous": rng.random() < 0.2,
+                "creator_id": rng.choice(user_ids),
+                "public_link": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "created_at": created,
+                "archived": rng.random() < 0.05,
+                "deadline": deadline,
+            })
+        # O primeiro usuário sempre tem enquetes (para o benchmark do dashboard)
+        for row in poll_rows[:10]:
+            row["creator_id"] = user_ids[0]
+        conn.execute(insert(models.Poll), poll_rows)
+        poll_table = models.Poll.__table__
+        poll_info = [tuple(row) for row in conn.execute(poll_table.select().with_only_columns(poll_table.c.id, poll_table.c.created_at, poll_table.c.anonymous))]
+
+        option_rows = [{"poll_id": poll_id, "text": f"Opção {j}"} for poll_id, _, _ in poll_info for j in range(options)]
+        conn.execute(insert(models.Option), option_rows)
+        option_table = models.Option.__table__
+        options_by_poll = {}
+        for option_id, poll_id in conn.execute(option_table.select().with_only_columns(option_table.c.id, option_table.c.poll_id)):
+            options_by_poll.setdefault(poll_id, []).append(option_id)
+
+        # Votos com distribuição desigual: poucas enquetes concentram a maior parte
+        weights = [1 / (rank + 1) for rank in range(len(poll_info))]
+        rows = []
+        for poll_id, created, anonymous in rng.choices(poll_info, weights=weights, k=votes):
+            created = created.replace(tzinfo=None) if created else now - timedelta(days=30)
+            rows.append({
+                "poll_id": poll_id,
+                "option_id": rng.choice(options_by_poll[poll_id]),
+                "voter_ip": voter_key(random_ip(rng), anonymous),
+                "voted_at": created + (now - created) * rng.random(),
+            })
+            if len(rows) >= batch:
+                conn.execute(insert(models.Vote), rows)
+                rows = []
+        if rows:
+            conn.execute(insert(models.Vote), rows)
+
+        # Contadores de votos por IP (limite aplicado no voto, ver vote_limit.py)
+        import vote_limit
+        vote_limit.rebuild(conn)
+        # Contadores por opção (ver vote_counters.py)
+        import vote_counters
+        vote_counters.rebuild(conn)
+
+    return {"users": users + 1, "polls": polls, "options": polls * options, "votes": votes}
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos para os benchmarks.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--votes", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        parser.error("Defina DATABASE_URL (ex: sqlite:////tmp/enquetes-bench.db). O banco será APAGADO e recriado.")
+
+    print(seed(args.users, args.polls, args.options, args.votes, args.seed))
+
+if __name__ == "__main__":
+    main()
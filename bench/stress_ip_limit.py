@@ -0,0 +1,132 @@
+"""
+Teste de estresse do limite de votos por IP: dispara muitos votos simultâneos
+de poucos IPs numa enquete com checagem de IP e confere no banco que nenhum
+IP passou de MAX_VOTES_PER_IP. Sai com código 1 se o limite for violado.
+
+Uso (na própria aplicação, sem servidor):
+    DATABASE_URL=sqlite:////tmp/enquetes-bench.db python bench/stress_ip_limit.py
+
+Contra um servidor (mesmo banco no DATABASE_URL; o servidor deve rodar com RATE_LIMIT_ENABLED=0):
+    DATABASE_URL=mysql+mysqlconnector://... python bench/stress_ip_limit.py --url http://localhost:8000 --concurrency 200
+Aí todos os votos saem do IP desta máquina (--ips vale 1): o servidor não aceita IP informado no cabeçalho.
+
+O SQLite serializa todas as escritas, então a prova só vale de verdade no MySQL.
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+from collections import Counter
+
+import httpx
+
+from seed import load_app
+
+def create_poll(options: int) -> tuple[str, list[int]]:
+    database, models = load_app()
+    db = database.SessionLocal()
+    try:
+        user = db.query(models.User).first()
+        if not user:
+            raise SystemExit("Nenhum usuário no banco. Rode bench/seed.py antes.")
+        poll = models.Poll(
+            title="Estresse do limite por IP", creator_id=user.id, public_link=str(uuid.uuid4()),
+            check_ip=True, is_public=False, multiple_choice=False
+        )
+        db.add(poll)
+        db.flush()
+        option_ids = []
+        for i in range(options):
+            option = models.Option(poll_id=poll.id, text=f"Opção {i}")
+            db.add(option)
+            db.flush()
+            option_ids.append(option.id)
+        db.commit()
+        return poll.public_link, option_ids
+    finally:
+        db.close()
+
+def votes_by_ip(public_link: str) -> Counter:
+    database, models = load_app()
+    db = database.SessionLocal()
+    try:
+        poll = db.query(models.Poll).filter(models.Poll.public_link == public_link).one()
+        rows = db.query(models.Vote.voter_ip).filter(models.Vote.poll_id == poll.id).all()
+        return Counter(voter_ip for (voter_ip,) in rows)
+    finally:
+        db.close()
+
+async def fire(base_url: str, transports: list, public_link: str, option_ids: list[int], requests: int, concurrency: int):
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    start_gate = asyncio.Event()
+
+    async def vote(i: int):
+        # Cliente novo a cada voto: sem cookie, só o limite por IP pode barrar
+        async with semaphore:
+            # Em processo, o IP de origem é o da conexão (client do transporte ASGI)
+            transport = transports[i % len(transports)]
+            async with httpx.AsyncClient(base_url=base_url, transport=transport, follow_redirects=False, timeout=60) as client:
+                await start_gate.wait()
+                try:
+                    response = await client.post(
+                        f"/polls/{public_link}/vote",
+                        data={"option": option_ids[i % len(option_ids)]},
+                    )
+                    accepted = "voted=true" in response.headers.get("location", "") and "voted_polls" in response.headers.get("set-cookie", "")
+                    statuses["aceito" if accepted else f"recusado ({response.status_code})"] += 1
+                except httpx.HTTPError:
+                    statuses["erro"] += 1
+
+    tasks = [asyncio.create_task(vote(i)) for i in range(requests)]
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    start_gate.set()
+    await asyncio.gather(*tasks)
+    return statuses, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Estresse do limite de votos por IP.")
+    parser.add_argument("--url", help="Servidor alvo (padrão: a aplicação em processo, via ASGI)")
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--ips", type=int, default=3, help="Quantidade de IPs diferentes (poucos IPs = mais disputa)")
+    parser.add_argument("--options", type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if not os.getenv("DATABASE_URL"):
+        parser.error("Defina DATABASE_URL apontando para o banco gerado por bench/seed.py.")
+
+    load_app()
+    if args.url:
+        args.ips = 1
+        base_url, transports = args.url, [None]
+    else:
+        os.environ["RATE_LIMIT_ENABLED"] = "0"
+        import main as app_main
+        # Um transporte por IP simulado
+        ips = [f"198.51.100.{i + 1}" for i in range(args.ips)]
+        base_url, transports = "http://bench", [httpx.ASGITransport(app=app_main.app, client=(ip, 123)) for ip in ips]
+
+    from poll import MAX_VOTES_PER_IP
+
+    public_link, option_ids = create_poll(args.options)
+    statuses, elapsed = asyncio.run(fire(base_url, transports, public_link, option_ids, args.requests, args.concurrency))
+
+    counts = votes_by_ip(public_link)
+    print(f"{args.requests} votos de {args.ips} IPs em {elapsed:.2f}s ({args.requests / elapsed:.0f} req/s, concorrência {args.concurrency})")
+    for status, total in sorted(statuses.items()):
+        print(f"  {status}: {total}")
+    print(f"Votos gravados por IP: {sorted(counts.values(), reverse=True)} (limite {MAX_VOTES_PER_IP})")
+
+    violations = [total for total in counts.values() if total > MAX_VOTES_PER_IP]
+    if violations or len(counts) < args.ips:
+        print("❌ Limite por IP violado!" if violations else "❌ Algum IP não conseguiu votar.")
+        raise SystemExit(1)
+    print("✅ Limite por IP respeitado.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Vazão de votos x escritores simultâneos, com e sem shards nos contadores.
+Todos votam na MESMA opção (o pior caso: um contador só seria disputado por todos).
+Cada voto é uma transação igual à de vote_poll: INSERT em votes + contador + COMMIT.
+
+Uso:
+    DATABASE_URL=mysql+mysqlconnector://... python bench/vote_throughput.py --writers 1,4,16,64 --shards 1,16
+
+No SQLite as escritas são serializadas pelo próprio banco, então os números
+só mostram a diferença entre shards no MySQL (locks por linha).
+"""
+import os
+import time
+import uuid
+import argparse
+import threading
+from types import SimpleNamespace
+
+from seed import load_app
+
+def create_poll(database, models, shards: int):
+    db = database.SessionLocal()
+    try:
+        user = db.query(models.User).first()
+        if not user:
+            raise SystemExit("Nenhum usuário no banco. Rode bench/seed.py antes.")
+        poll = models.Poll(
+            title=f"Vazão de votos ({shards} shards)", creator_id=user.id, public_link=str(uuid.uuid4()),
+            check_ip=False, is_public=False, counter_shards=shards
+        )
+        db.add(poll)
+        db.flush()
+        option = models.Option(poll_id=poll.id, text="Opção disputada")
+        db.add(option)
+        db.commit()
+        return SimpleNamespace(id=poll.id, counter_shards=shards), option.id
+    finally:
+        db.close()
+
+def run(database, models, vote_counters, poll, option_id: int, writers: int, votes_per_writer: int):
+    errors = []
+    barrier = threading.Barrier(writers + 1)
+
+    def writer(index: int):
+        db = database.SessionLocal()
+        try:
+            barrier.wait()
+            for i in range(votes_per_writer):
+                db.add(models.Vote(poll_id=poll.id, option_id=option_id, voter_ip=(index * votes_per_writer + i).to_bytes(16, "big")))
+                vote_counters.add_votes(db, poll, [option_id])
+                db.commit()
+        except Exception as e:
+            db.rollback()
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return elapsed, errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão de votos com contadores divididos em shards.")
+    parser.add_argument("--writers", default="1,2,4,8,16,32", help="Escritores simultâneos a testar")
+    parser.add_argument("--shards", default="1,16", help="Shards por opção a comparar")
+    parser.add_argument("--votes-per-writer", type=int, default=200)
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        parser.error("Defina DATABASE_URL apontando para o banco gerado por bench/seed.py.")
+
+    database, models = load_app()
+    import vote_counters
+
+    writer_counts = [int(value) for value in args.writers.split(",")]
+    shard_counts = [int(value) for value in args.shards.split(",")]
+    # Engine própria com uma conexão por escritor (o pool padrão tem 15)
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    options = dict(database.engine_options)
+    if not database.DATABASE_URL.startswith("sqlite"):
+        options.update(pool_size=max(writer_counts), max_overflow=5)
+    database.engine = create_engine(database.DATABASE_URL, **options)
+    database.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+
+    print(f"{'escritores':>10}" + "".join(f"{f'{shards} shard(s) votos/s':>22}" for shards in shard_counts))
+    for writers in writer_counts:
+        line = f"{writers:>10}"
+        for shards in shard_counts:
+            poll, option_id = create_poll(database, models, shards)
+            elapsed, errors = run(database, models, vote_counters, poll, option_id, writers, args.votes_per_writer)
+            db = database.SessionLocal()
+            try:
+                counted = vote_counters.get_option_counts(db, poll.id).get(option_id, 0)
+            finally:
+                db.close()
+            expected = (writers - len(errors)) * args.votes_per_writer
+            cell = f"{counted / elapsed:,.0f}" if elapsed else "-"
+            if errors:
+                cell += f" ({len(errors)} erros)"
+            elif counted != expected:
+                cell += " (contagem errada!)"
+            line += f"{cell:>22}"
+        print(line)
+
+if __name__ == "__main__":
+    main()